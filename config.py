@@ -6,6 +6,11 @@ load_dotenv()
 class Config:
     # Database Configuration
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./agora_webhooks.db")
+    # Channel quality/multi-user analytics hold 2 connections per request (one query runs on a second session),
+    # so DB_POOL_SIZE + DB_MAX_OVERFLOW should cover twice the concurrent analytics requests
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))          # pooled connections kept open (non-SQLite)
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))    # extra connections allowed under load
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
     
     # Server Configuration
     HOST = os.getenv("HOST", "0.0.0.0")
@@ -21,3 +26,13 @@ class Config:
     
     # Background Processing
     MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))
+    WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))   # max webhooks committed per transaction
+    WEBHOOK_FLUSH_MS = int(os.getenv("WEBHOOK_FLUSH_MS", "50"))        # how long a batch waits to fill up
+    WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000")) # queued webhooks before receivers wait
+    DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "3600"))     # how long notice_ids are remembered in memory
+    DEDUP_BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "1000000"))  # notice_ids per window the Bloom filter is sized for
+    WEBHOOK_BATCH_RETRIES = int(os.getenv("WEBHOOK_BATCH_RETRIES", "3"))      # attempts at a failing batch before it is dead-lettered
+    WEBHOOK_DEAD_LETTER_FILE = os.getenv("WEBHOOK_DEAD_LETTER_FILE", "failed_webhooks.jsonl")  # webhooks that could not be applied
+    
+    # Rate limiting (optional shared Redis backend; in-memory when unset)
+    REDIS_URL = os.getenv("REDIS_URL")
@@ -1,11 +1,29 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Index, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Float, Text, Index, Boolean, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import logging
 from datetime import datetime
 from config import Config
 
+logger = logging.getLogger(__name__)
+
 # Database setup
-engine = create_engine(Config.DATABASE_URL, echo=False)
+# Pooled connections: sessions borrow one per unit of work; stale ones are checked before use and recycled
+engine_options = {"pool_pre_ping": True, "pool_recycle": Config.DB_POOL_RECYCLE}
+if not Config.DATABASE_URL.startswith("sqlite"):
+    engine_options.update(pool_size=Config.DB_POOL_SIZE, max_overflow=Config.DB_MAX_OVERFLOW)
+engine = create_engine(Config.DATABASE_URL, echo=False, **engine_options)
+
+if Config.DATABASE_URL.startswith("sqlite"):
+    # pysqlite only opens a transaction before DML, so a SAVEPOINT issued first would run outside one and
+    # its RELEASE would commit; SQLAlchemy's documented workaround lets it emit BEGIN itself instead
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin_sqlite_transaction(connection):
+        connection.exec_driver_sql("BEGIN")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -39,8 +57,12 @@ class WebhookEvent(Base):
     # Indexes for performance
     __table_args__ = (
         Index('idx_app_channel_ts', 'app_id', 'channel_name', 'ts'),
+        # Channel create/destroy lookups when resolving a webhook's channel epoch
+        Index('idx_app_channel_event_ts', 'app_id', 'channel_name', 'event_type', 'ts'),
         Index('idx_app_uid_ts', 'app_id', 'uid', 'ts'),
         Index('idx_app_event_ts', 'app_id', 'event_type', 'ts'),
+        # Export date range (MIN/MAX received_at per app)
+        Index('idx_app_received_at', 'app_id', 'received_at'),
     )
 
 class ChannelSession(Base):
@@ -90,6 +112,27 @@ class ChannelSession(Base):
     __table_args__ = (
         Index('idx_app_channel_uid', 'app_id', 'channel_name', 'uid'),
         Index('idx_app_join_time', 'app_id', 'join_time'),
+        # Channel (and channel session) lookups; INCLUDE enables index-only aggregates on PostgreSQL
+        Index('idx_app_channel_session_uid', 'app_id', 'channel_name', 'channel_session_id', 'uid',
+              postgresql_include=['duration_seconds', 'reason', 'product_id', 'platform', 'role_switches', 'is_host']),
+        # Per-user lookups ordered by join time
+        Index('idx_app_uid_join_time', 'app_id', 'uid', 'join_time'),
+        # Minutes analytics time-window scans: completed sessions and still-active sessions
+        Index('idx_app_join_leave_complete', 'app_id', 'join_time', 'leave_time',
+              postgresql_where=text('duration_seconds IS NOT NULL'),
+              sqlite_where=text('duration_seconds IS NOT NULL')),
+        Index('idx_app_join_active', 'app_id', 'join_time',
+              postgresql_where=text('leave_time IS NULL'),
+              sqlite_where=text('leave_time IS NULL')),
+        # Minutes analytics per-day GROUP BY over platform/client type; INCLUDE keeps it index-only on PostgreSQL
+        Index('idx_app_join_platform_client_type', 'app_id', 'join_time', 'platform', 'client_type',
+              postgresql_include=['leave_time', 'duration_seconds', 'is_host']),
+        # Webhook join/leave/role lookups of a user's open session, newest first
+        Index('idx_app_channel_uid_open', 'app_id', 'channel_name', 'uid', 'join_time',
+              postgresql_where=text('leave_time IS NULL'),
+              sqlite_where=text('leave_time IS NULL')),
+        # Per-channel join-day ranges (metrics first-visit check, provisional session merges)
+        Index('idx_app_channel_join_time', 'app_id', 'channel_name', 'join_time'),
     )
 
 class ChannelMetrics(Base):
@@ -216,6 +259,23 @@ class RoleEvent(Base):
         Index('idx_role_channel_session_uid_ts', 'channel_session_id', 'uid', 'ts'),
     )
 
+class AppDimensionSummary(Base):
+    """Distinct (platform, client_type) pairs seen per app, kept up to date on webhook ingest"""
+    __tablename__ = "app_dimension_summary"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    app_id = Column(String(50), nullable=False, index=True)
+    platform = Column(Integer, nullable=True)
+    client_type = Column(Integer, nullable=True)
+    
+    # Metadata
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Unique constraint
+    __table_args__ = (
+        Index('idx_app_platform_client_type', 'app_id', 'platform', 'client_type', unique=True),
+    )
+
 class QualityMetrics(Base):
     """Channel and session quality metrics"""
     __tablename__ = "quality_metrics"
@@ -253,6 +313,21 @@ class QualityMetrics(Base):
 def create_tables():
     """Create all database tables"""
     Base.metadata.create_all(bind=engine)
+    # create_all only creates indexes together with new tables, so add any missing ones to existing tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logger.warning(f"Could not create index {index.name} on {table.name}: {e}")
+    
+    # Seed the dimension summary from existing sessions the first time it is created
+    with engine.begin() as connection:
+        if connection.execute(text("SELECT 1 FROM app_dimension_summary LIMIT 1")).first() is None:
+            connection.execute(text(
+                "INSERT INTO app_dimension_summary (app_id, platform, client_type, created_at) "
+                "SELECT DISTINCT app_id, platform, client_type, CURRENT_TIMESTAMP FROM channel_sessions"
+            ))
 
 def get_db():
     """Dependency to get database session"""
@@ -12,15 +12,58 @@ import io
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from io import StringIO, BytesIO
+from itertools import islice
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func, select
 
-from database import WebhookEvent, ChannelSession, ChannelMetrics, UserMetrics, RoleEvent
+from database import SessionLocal, WebhookEvent, ChannelSession, ChannelMetrics, UserMetrics, RoleEvent
 from models import ExportRequest, ExportResponse
 from mappings import get_platform_name, get_product_name
 
 logger = logging.getLogger(__name__)
 
+# Human-readable event type names (built once instead of per exported row)
+EVENT_TYPE_NAMES = {
+    1: "User Joined Channel",
+    2: "User Left Channel", 
+    103: "User Joined Channel (RTC)",
+    104: "User Left Channel (RTC)",
+    101: "Channel Created",
+    102: "Channel Destroyed",
+    103: "Broadcaster Join",
+    104: "Broadcaster Leave",
+    105: "Audience Join",
+    106: "Audience Leave",
+    107: "Communication Join",
+    108: "Communication Leave",
+    111: "Role Change to Broadcaster",
+    112: "Role Change to Audience"
+}
+
+# Streamed zip exports are flushed to the client in pieces of about this size
+ZIP_STREAM_CHUNK_SIZE = 2 * 1024 * 1024
+
+class ZipStreamSink:
+    """Write-only file object that collects zipfile output until it is drained"""
+    
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+    
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        self.size = 0
+        return data
+
 class ExportService:
     """Service for exporting webhook data in various formats"""
     
@@ -245,23 +288,7 @@ class ExportService:
     
     def _get_event_type_name(self, event_type: int) -> str:
         """Get human-readable event type name"""
-        event_types = {
-            1: "User Joined Channel",
-            2: "User Left Channel", 
-            103: "User Joined Channel (RTC)",
-            104: "User Left Channel (RTC)",
-            101: "Channel Created",
-            102: "Channel Destroyed",
-            103: "Broadcaster Join",
-            104: "Broadcaster Leave",
-            105: "Audience Join",
-            106: "Audience Leave",
-            107: "Communication Join",
-            108: "Communication Leave",
-            111: "Role Change to Broadcaster",
-            112: "Role Change to Audience"
-        }
-        return event_types.get(event_type, f"Unknown Event ({event_type})")
+        return EVENT_TYPE_NAMES.get(event_type, f"Unknown Event ({event_type})")
     
     def _format_role_event(self, event: RoleEvent) -> Dict[str, Any]:
         """Format role event for export"""
@@ -384,7 +411,8 @@ class ExportService:
     
     def _estimate_total_records(self, request: ExportRequest, end_date_inclusive: datetime) -> int:
         """Estimate total number of records for the export"""
-        total = 0
+        # Each table is counted in a scalar subquery so all counts come back in one round trip
+        counts = []
         
         # Build base query conditions
         conditions = [
@@ -398,7 +426,7 @@ class ExportService:
         
         # Count webhook events
         if request.include_webhook_events:
-            total += self.db.query(WebhookEvent).filter(and_(*conditions)).count()
+            counts.append(select(func.count(WebhookEvent.id)).where(*conditions).scalar_subquery())
         
         # Count sessions
         if request.include_sessions:
@@ -409,7 +437,7 @@ class ExportService:
             ]
             if request.channel_name:
                 session_conditions.append(ChannelSession.channel_name == request.channel_name)
-            total += self.db.query(ChannelSession).filter(and_(*session_conditions)).count()
+            counts.append(select(func.count(ChannelSession.id)).where(*session_conditions).scalar_subquery())
         
         # Count metrics
         if request.include_metrics:
@@ -421,7 +449,7 @@ class ExportService:
             ]
             if request.channel_name:
                 channel_metric_conditions.append(ChannelMetrics.channel_name == request.channel_name)
-            total += self.db.query(ChannelMetrics).filter(and_(*channel_metric_conditions)).count()
+            counts.append(select(func.count(ChannelMetrics.id)).where(*channel_metric_conditions).scalar_subquery())
             
             # User metrics
             user_metric_conditions = [
@@ -431,9 +459,12 @@ class ExportService:
             ]
             if request.channel_name:
                 user_metric_conditions.append(UserMetrics.channel_name == request.channel_name)
-            total += self.db.query(UserMetrics).filter(and_(*user_metric_conditions)).count()
+            counts.append(select(func.count(UserMetrics.id)).where(*user_metric_conditions).scalar_subquery())
+        
+        if not counts:
+            return 0
         
-        return total
+        return sum(count or 0 for count in self.db.query(*counts).one())
     
     def _export_chunked_csv(self, request: ExportRequest, end_date_inclusive: datetime, total_records: int) -> Dict[str, Any]:
         """Export large datasets in chunks to prevent database lockup"""
@@ -442,52 +473,67 @@ class ExportService:
         
         logger.info(f"Exporting {total_records} records in {total_chunks} chunks of {chunk_size}")
         
-        # Create zip file for chunks
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Export webhook events in chunks
-            if request.include_webhook_events:
-                self._export_webhook_events_chunked(request, end_date_inclusive, chunk_size, zip_file)
-            
-            # Export sessions in chunks
-            if request.include_sessions:
-                self._export_sessions_chunked(request, end_date_inclusive, chunk_size, zip_file)
-            
-            # Export metrics in chunks
-            if request.include_metrics:
-                self._export_metrics_chunked(request, end_date_inclusive, chunk_size, zip_file)
-        
-        zip_buffer.seek(0)
         return {
-            "zip_content": zip_buffer.getvalue(),
+            "zip_stream": self._stream_chunked_csv(request, end_date_inclusive, chunk_size),
             "content_type": "application/zip",
             "filename": f"agora_export_chunked_{request.app_id}_{request.start_date.strftime('%Y%m%d')}_{request.end_date.strftime('%Y%m%d')}.zip",
             "total_records": total_records,
             "chunks": total_chunks
         }
     
+    def _stream_chunked_csv(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int):
+        """Yield the chunked zip archive piece by piece while it is being written"""
+        # The response streams after the request's session is closed, so use a dedicated one
+        stream_service = ExportService(SessionLocal())
+        sink = ZipStreamSink()
+        try:
+            with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zip_file:
+                for _ in stream_service._write_chunked_entries(request, end_date_inclusive, chunk_size, zip_file):
+                    if sink.size >= ZIP_STREAM_CHUNK_SIZE:
+                        yield sink.drain()
+            # Central directory is written when the archive closes
+            yield sink.drain()
+        finally:
+            stream_service.db.close()
+    
+    def _write_chunked_entries(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int, zip_file):
+        """Write every CSV chunk into the zip, yielding after each entry"""
+        # Export webhook events in chunks
+        if request.include_webhook_events:
+            yield from self._export_webhook_events_chunked(request, end_date_inclusive, chunk_size, zip_file)
+        
+        # Export sessions in chunks
+        if request.include_sessions:
+            yield from self._export_sessions_chunked(request, end_date_inclusive, chunk_size, zip_file)
+        
+        # Export metrics in chunks
+        if request.include_metrics:
+            yield from self._export_metrics_chunked(request, end_date_inclusive, chunk_size, zip_file)
+    
+    def _iter_query_chunks(self, query, chunk_size: int):
+        """Yield lists of up to chunk_size rows from a single server-side streamed query"""
+        rows = iter(query.execution_options(stream_results=True).yield_per(chunk_size))
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    
     def _export_webhook_events_chunked(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int, zip_file):
         """Export webhook events in chunks"""
-        offset = 0
-        chunk_num = 1
+        # Build query conditions
+        conditions = [
+            WebhookEvent.app_id == request.app_id,
+            WebhookEvent.ts >= int(request.start_date.timestamp()),
+            WebhookEvent.ts < int(end_date_inclusive.timestamp())
+        ]
         
-        while True:
-            # Build query conditions
-            conditions = [
-                WebhookEvent.app_id == request.app_id,
-                WebhookEvent.ts >= int(request.start_date.timestamp()),
-                WebhookEvent.ts < int(end_date_inclusive.timestamp())
-            ]
-            
-            if request.channel_name:
-                conditions.append(WebhookEvent.channel_name == request.channel_name)
-            
-            # Get chunk of webhook events
-            events = self.db.query(WebhookEvent).filter(and_(*conditions)).offset(offset).limit(chunk_size).all()
-            
-            if not events:
-                break
-            
+        if request.channel_name:
+            conditions.append(WebhookEvent.channel_name == request.channel_name)
+        
+        # Stream one query in chunk_size batches instead of re-running it with OFFSET per chunk
+        query = self.db.query(WebhookEvent).filter(and_(*conditions)).order_by(WebhookEvent.id)
+        for chunk_num, events in enumerate(self._iter_query_chunks(query, chunk_size), start=1):
             # Convert to export format
             events_data = [self._format_webhook_event(event) for event in events]
             
@@ -495,33 +541,24 @@ class ExportService:
             csv_content = self._create_csv_from_data(events_data, "webhook_events")
             zip_file.writestr(f"webhook_events_chunk_{chunk_num:03d}.csv", csv_content)
             
-            offset += chunk_size
-            chunk_num += 1
-            
-            logger.info(f"Exported webhook events chunk {chunk_num - 1}")
+            logger.info(f"Exported webhook events chunk {chunk_num}")
+            yield chunk_num
     
     def _export_sessions_chunked(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int, zip_file):
         """Export sessions in chunks"""
-        offset = 0
-        chunk_num = 1
+        # Build query conditions
+        conditions = [
+            ChannelSession.app_id == request.app_id,
+            ChannelSession.join_time >= request.start_date,
+            ChannelSession.join_time < end_date_inclusive
+        ]
         
-        while True:
-            # Build query conditions
-            conditions = [
-                ChannelSession.app_id == request.app_id,
-                ChannelSession.join_time >= request.start_date,
-                ChannelSession.join_time < end_date_inclusive
-            ]
-            
-            if request.channel_name:
-                conditions.append(ChannelSession.channel_name == request.channel_name)
-            
-            # Get chunk of sessions
-            sessions = self.db.query(ChannelSession).filter(and_(*conditions)).offset(offset).limit(chunk_size).all()
-            
-            if not sessions:
-                break
-            
+        if request.channel_name:
+            conditions.append(ChannelSession.channel_name == request.channel_name)
+        
+        # Stream one query in chunk_size batches instead of re-running it with OFFSET per chunk
+        query = self.db.query(ChannelSession).filter(and_(*conditions)).order_by(ChannelSession.id)
+        for chunk_num, sessions in enumerate(self._iter_query_chunks(query, chunk_size), start=1):
             # Convert to export format
             sessions_data = [self._format_session(session) for session in sessions]
             
@@ -529,41 +566,32 @@ class ExportService:
             csv_content = self._create_csv_from_data(sessions_data, "sessions")
             zip_file.writestr(f"sessions_chunk_{chunk_num:03d}.csv", csv_content)
             
-            offset += chunk_size
-            chunk_num += 1
-            
-            logger.info(f"Exported sessions chunk {chunk_num - 1}")
+            logger.info(f"Exported sessions chunk {chunk_num}")
+            yield chunk_num
     
     def _export_metrics_chunked(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int, zip_file):
         """Export metrics in chunks"""
         # Export channel metrics
-        self._export_channel_metrics_chunked(request, end_date_inclusive, chunk_size, zip_file)
+        yield from self._export_channel_metrics_chunked(request, end_date_inclusive, chunk_size, zip_file)
         
         # Export user metrics
-        self._export_user_metrics_chunked(request, end_date_inclusive, chunk_size, zip_file)
+        yield from self._export_user_metrics_chunked(request, end_date_inclusive, chunk_size, zip_file)
     
     def _export_channel_metrics_chunked(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int, zip_file):
         """Export channel metrics in chunks"""
-        offset = 0
-        chunk_num = 1
+        # Build query conditions
+        conditions = [
+            ChannelMetrics.app_id == request.app_id,
+            ChannelMetrics.date >= request.start_date,
+            ChannelMetrics.date < end_date_inclusive
+        ]
         
-        while True:
-            # Build query conditions
-            conditions = [
-                ChannelMetrics.app_id == request.app_id,
-                ChannelMetrics.date >= request.start_date,
-                ChannelMetrics.date < end_date_inclusive
-            ]
-            
-            if request.channel_name:
-                conditions.append(ChannelMetrics.channel_name == request.channel_name)
-            
-            # Get chunk of channel metrics
-            metrics = self.db.query(ChannelMetrics).filter(and_(*conditions)).offset(offset).limit(chunk_size).all()
-            
-            if not metrics:
-                break
-            
+        if request.channel_name:
+            conditions.append(ChannelMetrics.channel_name == request.channel_name)
+        
+        # Stream one query in chunk_size batches instead of re-running it with OFFSET per chunk
+        query = self.db.query(ChannelMetrics).filter(and_(*conditions)).order_by(ChannelMetrics.id)
+        for chunk_num, metrics in enumerate(self._iter_query_chunks(query, chunk_size), start=1):
             # Convert to export format
             metrics_data = [self._format_channel_metrics(metric) for metric in metrics]
             
@@ -571,33 +599,24 @@ class ExportService:
             csv_content = self._create_csv_from_data(metrics_data, "channel_metrics")
             zip_file.writestr(f"channel_metrics_chunk_{chunk_num:03d}.csv", csv_content)
             
-            offset += chunk_size
-            chunk_num += 1
-            
-            logger.info(f"Exported channel metrics chunk {chunk_num - 1}")
+            logger.info(f"Exported channel metrics chunk {chunk_num}")
+            yield chunk_num
     
     def _export_user_metrics_chunked(self, request: ExportRequest, end_date_inclusive: datetime, chunk_size: int, zip_file):
         """Export user metrics in chunks"""
-        offset = 0
-        chunk_num = 1
+        # Build query conditions
+        conditions = [
+            UserMetrics.app_id == request.app_id,
+            UserMetrics.date >= request.start_date,
+            UserMetrics.date < end_date_inclusive
+        ]
         
-        while True:
-            # Build query conditions
-            conditions = [
-                UserMetrics.app_id == request.app_id,
-                UserMetrics.date >= request.start_date,
-                UserMetrics.date < end_date_inclusive
-            ]
-            
-            if request.channel_name:
-                conditions.append(UserMetrics.channel_name == request.channel_name)
-            
-            # Get chunk of user metrics
-            metrics = self.db.query(UserMetrics).filter(and_(*conditions)).offset(offset).limit(chunk_size).all()
-            
-            if not metrics:
-                break
-            
+        if request.channel_name:
+            conditions.append(UserMetrics.channel_name == request.channel_name)
+        
+        # Stream one query in chunk_size batches instead of re-running it with OFFSET per chunk
+        query = self.db.query(UserMetrics).filter(and_(*conditions)).order_by(UserMetrics.id)
+        for chunk_num, metrics in enumerate(self._iter_query_chunks(query, chunk_size), start=1):
             # Convert to export format
             metrics_data = [self._format_user_metrics(metric) for metric in metrics]
             
@@ -605,10 +624,8 @@ class ExportService:
             csv_content = self._create_csv_from_data(metrics_data, "user_metrics")
             zip_file.writestr(f"user_metrics_chunk_{chunk_num:03d}.csv", csv_content)
             
-            offset += chunk_size
-            chunk_num += 1
-            
-            logger.info(f"Exported user metrics chunk {chunk_num - 1}")
+            logger.info(f"Exported user metrics chunk {chunk_num}")
+            yield chunk_num
     
     def create_public_share_url(self, request: ExportRequest, token: str) -> str:
         """Create a public share URL with read-only token"""
@@ -617,11 +634,15 @@ class ExportService:
         base_url = "https://your-domain.com"  # This should be configurable
         return f"{base_url}/api/export/public/{token}"
     
+    def count_records(self, request: ExportRequest) -> int:
+        """Count the records an export request would include"""
+        end_date_inclusive = request.end_date + timedelta(days=1) if request.end_date else datetime.utcnow() + timedelta(days=1)
+        return self._estimate_total_records(request, end_date_inclusive)
+    
     def validate_export_limits(self, request: ExportRequest) -> Dict[str, Any]:
         """Validate export request against limits"""
         # Estimate total records
-        end_date_inclusive = request.end_date + timedelta(days=1) if request.end_date else datetime.utcnow() + timedelta(days=1)
-        total_records = self._estimate_total_records(request, end_date_inclusive)
+        total_records = self.count_records(request)
         
         # Check limits
         limits = {
@@ -1,27 +1,34 @@
 import asyncio
-import json
 import logging
 import time
 import functools
-from datetime import datetime, timedelta
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_right
+from itertools import accumulate, islice
+from operator import itemgetter
+from datetime import datetime, timedelta, time as dt_time, timezone
 from calendar import monthrange
 from typing import Dict, Any, Optional
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Depends, Form
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_, or_
+from sqlalchemy import func, desc, and_, or_, case, text, tuple_
 import uvicorn
 
 from config import Config
-from database import get_db, create_tables, ChannelSession, ChannelMetrics, UserMetrics, WebhookEvent, RoleEvent
+from database import get_db, create_tables, SessionLocal, ChannelSession, ChannelMetrics, UserMetrics, WebhookEvent, RoleEvent, AppDimensionSummary
 from models import WebhookRequest, ChannelSessionResponse, ChannelMetricsResponse, UserMetricsResponse, ChannelListResponse, ChannelDetailResponse, ExportRequest, ExportResponse, UserDetailResponse, RoleAnalyticsResponse, QualityMetricsResponse, MinutesAnalyticsRequest, MinutesAnalyticsResponse
 from webhook_processor import WebhookProcessor
 from export_service import ExportService
-from security import SecurityConfig, rate_limiter, get_rate_limit_headers, WebhookValidator, ExportSecurity
+from mappings import PLATFORM_MAPPING, get_client_type_name, get_platform_name as get_mapped_platform_name
+from security import SecurityConfig, MaxBodySizeMiddleware, SecurityHeadersMiddleware, rate_limiter, token_bucket_limiter, share_token_pool, build_rate_limit_headers, iter_rate_limit_headers, WebhookValidator, ExportSecurity
 
 # Configure logging
 logging.basicConfig(
@@ -34,6 +41,113 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Maximum number of points returned for the concurrency chart
+MAX_CONCURRENCY_POINTS = 500
+
+# Session length histogram: upper bounds (seconds) and bucket labels
+SESSION_LENGTH_BOUNDS = [5, 30, 60, 300, 900]
+SESSION_LENGTH_LABELS = ["0-5s", "5-30s", "30-60s", "1-5min", "5-15min", "15min+"]
+
+# Agora leave reason codes -> counter names used by the quality analytics
+REASON_CODE_MAP = {
+    1: 'good_exits',  # Normal leave
+    2: 'network_timeouts',  # Connection timeout
+    3: 'permission_issues',  # Permissions issue
+    4: 'server_issues',  # Server load adjustment
+    5: 'device_switches',  # Device switch
+    9: 'ip_switching',  # Multiple IP addresses
+    10: 'network_issues',  # Network connection problems
+    999: 'churn_events',  # Abnormal user
+    0: 'other_issues'  # Other reasons
+}
+
+def reason_count_columns():
+    """SQL columns counting sessions per leave reason code, labelled with the REASON_CODE_MAP names"""
+    return [
+        func.sum(case((ChannelSession.reason == code, 1), else_=0)).label(name)
+        for code, name in REASON_CODE_MAP.items()
+    ]
+
+async def run_queries_concurrently(db: Session, first_query_fn, *query_fns):
+    """Run independent read-only queries concurrently in worker threads: the first on the request's own
+    session, each other one on a session of its own (so a request holds 1 + len(query_fns) pool connections)"""
+    def run(query_fn):
+        query_db = SessionLocal()
+        try:
+            return query_fn(query_db)
+        finally:
+            query_db.close()
+    
+    return await asyncio.gather(
+        asyncio.to_thread(first_query_fn, db),
+        *(asyncio.to_thread(run, query_fn) for query_fn in query_fns)
+    )
+
+# Insight rules: (counter name, threshold, template); an insight is emitted when the counter exceeds the threshold
+GOOD_EXITS_INSIGHT = "✅ {n} normal exits (reason=1) - good user experience"
+# Exit reason insights shared by the user and channel views, ordered high -> medium -> low impact -> good
+REASON_INSIGHT_RULES = [
+    ('other_issues', 0, "🔴 {n} unknown issues (reason=0) - investigate further"),
+    ('network_timeouts', 0, "🟡 {n} connection timeouts (reason=2) - network instability"),
+    ('network_issues', 0, "🟡 {n} network connection problems (reason=10) - check connectivity"),
+    ('ip_switching', 0, "🟡 {n} IP switching events (reason=9) - VPN or multiple IPs detected"),
+    ('server_issues', 0, "🟡 {n} server load adjustments (reason=4) - Agora server issues"),
+    ('permission_issues', 0, "🟢 {n} permission issues (reason=3) - admin actions"),
+    ('device_switches', 0, "🟢 {n} device switches (reason=5) - user behavior"),
+    ('good_exits', 0, GOOD_EXITS_INSIGHT),
+]
+
+USER_INSIGHT_RULES = [
+    ('churn_events', 0, "🔴 User {uid} experienced {n} abnormal leaves (reason=999) - frequent join/leave"),
+    *REASON_INSIGHT_RULES,
+    ('failed_calls', 0, "📞 {n} failed calls detected (duration < 5s)"),
+    ('total_role_switches', 5, "🔄 High role switching activity: {n} switches"),
+]
+
+CHANNEL_INSIGHT_RULES = [
+    ('churn_events', 0, "🔴 {n} abnormal user events (reason=999) - frequent join/leave"),
+    *REASON_INSIGHT_RULES,
+    ('failed_calls', 0, "📞 {n} failed calls (duration < 5s)"),
+    ('test_channels', 0, "🧪 Test channel detected (only 1 user)"),
+]
+
+# Quality score penalties: (counters, penalty per event, max penalty)
+QUALITY_PENALTY_RULES = [
+    (('churn_events',), 15, 60),  # High impact: abnormal users
+    (('other_issues',), 10, 40),  # High impact: unknown issues
+    (('network_timeouts', 'network_issues', 'ip_switching'), 8, 35),  # Medium impact: network issues
+    (('server_issues',), 6, 25),  # Medium impact: server issues
+    (('permission_issues', 'device_switches'), 3, 15),  # Low impact: control issues
+    (('failed_calls',), 5, 30),  # Failed calls (short duration)
+    (('burst_sessions',), 5, 20),  # Burst reconnections (multi-user view only)
+]
+
+def compute_quality_score(counts, avg_session_length, total_exits, extra_penalty=0):
+    """Calculate a 0-100 quality score from reason-code counters"""
+    quality_score = 100 - extra_penalty
+    for keys, penalty, max_penalty in QUALITY_PENALTY_RULES:
+        count = sum(counts.get(key, 0) for key in keys)
+        if count:
+            quality_score -= min(count * penalty, max_penalty)
+    
+    # Session length impact
+    if avg_session_length < 1:
+        quality_score -= 20
+    
+    # Bonus for good exits (if most exits are normal)
+    if total_exits > 0 and counts.get('good_exits', 0) / total_exits > 0.7:
+        quality_score += 5
+    
+    return max(0, min(100, quality_score))  # Clamp between 0-100
+
+def build_insights(rules, counts, **context):
+    """Format the insight of every rule whose counter exceeds its threshold"""
+    return [
+        template.format(n=counts[key], **context)
+        for key, threshold, template in rules
+        if counts[key] > threshold
+    ]
+
 def calculate_role_minutes_from_events(sessions, role_events, channel_session_id, db=None):
     """Calculate host/audience minutes by splitting user presence segments at role changes"""
     host_minutes = 0.0
@@ -139,41 +253,117 @@ def calculate_max_concurrency(sessions):
     if not sessions:
         return 0, None, []
     
-    # Collect all join/leave events with timestamps
+    # Sweep line: +1 at every join, -1 at every leave
     events = []
     for session in sessions:
         if session.join_time:
-            events.append(('join', session.join_time.timestamp(), session.uid))
+            events.append((session.join_time.timestamp(), 1))
         if session.leave_time:
-            events.append(('leave', session.leave_time.timestamp(), session.uid))
+            events.append((session.leave_time.timestamp(), -1))
     
     if not events:
         return 0, None, []
     
-    # Sort events by timestamp
-    events.sort(key=lambda x: x[1])
+    # Sort events by timestamp (stable, so a join stays ahead of its own leave on ties)
+    events.sort(key=itemgetter(0))
+    timestamps = [timestamp for timestamp, _ in events]
+    
+    # Running sum of the deltas is the number of concurrent users after each event
+    running = list(accumulate(delta for _, delta in events))
     
-    # Track concurrent users at each point
-    active_users = set()
-    max_concurrent = 0
+    max_concurrent = max(0, max(running))
     peak_time = None
-    concurrency_over_time = []  # List of (timestamp, count) tuples
+    if max_concurrent > 0:
+        peak_time = datetime.fromtimestamp(timestamps[running.index(max_concurrent)])
     
-    for event_type, timestamp, uid in events:
-        if event_type == 'join':
-            active_users.add(uid)
-        else:  # leave
-            active_users.discard(uid)
-        
-        current_count = len(active_users)
-        concurrency_over_time.append((timestamp, current_count))
-        
-        if current_count > max_concurrent:
-            max_concurrent = current_count
-            peak_time = datetime.fromtimestamp(timestamp)
+    # Downsample the chart series; the peak above is computed from every event
+    step = max(1, len(events) // MAX_CONCURRENCY_POINTS)
+    concurrency_over_time = list(zip(timestamps[::step], running[::step]))  # List of (timestamp, count) tuples
     
     return max_concurrent, peak_time, concurrency_over_time
 
+def calculate_wall_clock_minutes(sessions):
+    """Calculate channel elapsed time (max leave - min join) in minutes in a single pass"""
+    min_join = None
+    max_leave = None
+    for session in sessions:
+        join_time = session.join_time
+        if join_time and (min_join is None or join_time < min_join):
+            min_join = join_time
+        leave_time = session.leave_time
+        if leave_time and (max_leave is None or leave_time > max_leave):
+            max_leave = leave_time
+    
+    if min_join is None or max_leave is None:
+        return None
+    return (max_leave - min_join).total_seconds() / 60.0
+
+# Day bucketing for minutes analytics works on integer microseconds since the epoch
+EPOCH = datetime(1970, 1, 1)
+MICROSECONDS_PER_DAY = 86400 * 1000000
+MICROSECONDS_PER_MINUTE = 60 * 1000000
+
+def to_epoch_us(value):
+    """Naive datetime to integer microseconds since the epoch"""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def add_minutes_by_day(buckets, start_us, end_us, first_day_us):
+    """Add the minutes of start_us..end_us that fall in each day bucket (bucket 0 starts at first_day_us)"""
+    first_index = max(0, (start_us - first_day_us) // MICROSECONDS_PER_DAY)
+    last_index = min(len(buckets) - 1, (end_us - first_day_us) // MICROSECONDS_PER_DAY)
+    
+    for day_index in range(first_index, last_index + 1):
+        day_start_us = first_day_us + day_index * MICROSECONDS_PER_DAY
+        # Days end at 23:59:59.999999, matching the datetime-based split
+        overlap_us = min(end_us, day_start_us + MICROSECONDS_PER_DAY - 1) - max(start_us, day_start_us)
+        if overlap_us > 0:
+            buckets[day_index] += overlap_us / MICROSECONDS_PER_MINUTE
+
+def split_spans_into_buckets(spans, series_count, day_count, first_day_us):
+    """Day buckets per series index for a list of (series_index, start_us, end_us) spans"""
+    buckets = [[0.0] * day_count for _ in range(series_count)]
+    for series_index, start_us, end_us in spans:
+        add_minutes_by_day(buckets[series_index], start_us, end_us, first_day_us)
+    return buckets
+
+# Large span sets are split across a process pool (the splitter is pure Python, so threads would not help)
+PARALLEL_SPLIT_MIN_SPANS = 20000
+split_executor = None
+
+def start_split_executor():
+    """Create the process pool for splitting large span sets (at startup, reused across requests)"""
+    global split_executor
+    if Config.MAX_WORKERS > 1:
+        split_executor = ProcessPoolExecutor(max_workers=Config.MAX_WORKERS)
+        # A fork pool starts all its workers on the first task; doing that now forks them before the
+        # webhook-db and to_thread worker threads exist, so no child inherits a lock held by one
+        split_executor.submit(int).result()
+
+def stop_split_executor():
+    """Shut the span-splitting process pool down (at app shutdown)"""
+    global split_executor
+    if split_executor is not None:
+        split_executor.shutdown(wait=True, cancel_futures=True)
+        split_executor = None
+
+async def split_spans_parallel(spans, series_count, day_count, first_day_us):
+    """Split spans in chunks on the process pool and sum the partial buckets"""
+    chunk_size = -(-len(spans) // Config.MAX_WORKERS)
+    loop = asyncio.get_running_loop()
+    partials = await asyncio.gather(*(
+        loop.run_in_executor(split_executor, split_spans_into_buckets,
+                             spans[start:start + chunk_size], series_count, day_count, first_day_us)
+        for start in range(0, len(spans), chunk_size)
+    ))
+    
+    buckets = partials[0]
+    for partial in partials[1:]:
+        for totals, part in zip(buckets, partial):
+            for day_index, minutes in enumerate(part):
+                if minutes:
+                    totals[day_index] += minutes
+    return buckets
+
 def analyze_user_reconnection_patterns(sessions, uid):
     """Analyze user reconnection patterns and burst behavior within the same call"""
     if not sessions:
@@ -256,26 +446,48 @@ webhook_processor = WebhookProcessor()
 
 # Webhook signature verification has been removed for simplified processing
 
+async def sweep_rate_limiter():
+    """Periodically drop idle keys from the in-memory rate limiter"""
+    while True:
+        await asyncio.sleep(SecurityConfig.RATE_LIMIT_SWEEP_INTERVAL)
+        try:
+            dropped = rate_limiter.sweep(SecurityConfig.RATE_LIMIT_MAX_WINDOW)
+            dropped += token_bucket_limiter.sweep(SecurityConfig.RATE_LIMIT_MAX_WINDOW)
+            if dropped:
+                logger.debug(f"Rate limiter sweep dropped {dropped} idle keys")
+        except Exception as e:
+            logger.warning(f"Rate limiter sweep failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background housekeeping for the lifetime of the app"""
+    start_split_executor()
+    sweeper = asyncio.create_task(sweep_rate_limiter())
+    batch_worker = asyncio.create_task(webhook_processor.run_batch_worker())
+    yield
+    # Let queued webhooks land before stopping the worker
+    try:
+        await asyncio.wait_for(webhook_processor.queue.join(), timeout=SecurityConfig.WEBHOOK_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutting down with {webhook_processor.queue.qsize()} webhooks still queued")
+    batch_worker.cancel()
+    webhook_processor.close()
+    sweeper.cancel()
+    stop_split_executor()
+
 # Create FastAPI app
-app = FastAPI(title="Agora Webhooks Server", version="1.0.0")
+app = FastAPI(title="Agora Webhooks Server", version="1.0.0", lifespan=lifespan)
 
 # Ensure UTF-8 encoding for JSON responses
 from fastapi.responses import JSONResponse as FastAPIJSONResponse
-import json as json_lib
+import orjson
 
 class UTF8JSONResponse(FastAPIJSONResponse):
     media_type = "application/json; charset=utf-8"
     
     def render(self, content) -> bytes:
-        json_str = json_lib.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            default=str
-        )
-        return json_str.encode("utf-8")
+        # orjson emits compact UTF-8 directly; non-string keys are stringified like the stdlib encoder
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
 
 app.default_response_class = UTF8JSONResponse
 
@@ -288,12 +500,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Rate limiting storage (in production, use Redis or similar)
-rate_limit_storage = {}
+# Compress JSON responses (analytics series grow with series x days); zip downloads opt out via Content-Encoding
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Reject oversized request bodies (by Content-Length, or while streaming) before any parsing
+app.add_middleware(MaxBodySizeMiddleware, max_size=SecurityConfig.MAX_PAYLOAD_SIZE)
 
 # Rate limiting decorator
-def rate_limit(max_requests: int = 100, window_seconds: int = 60):
-    """Simple rate limiting decorator"""
+def rate_limit(max_requests: int = 100, window_seconds: int = 60, smoothing: bool = False):
+    """Simple rate limiting decorator (smoothing=True uses a token bucket instead of a strict window)"""
     def decorator(func):
         import functools
         @functools.wraps(func)
@@ -318,42 +533,85 @@ def rate_limit(max_requests: int = 100, window_seconds: int = 60):
                 return await func(*args, **kwargs)
             
             client_ip = request.client.host if request.client else "unknown"
-            current_time = time.time()
             
-            # Clean old entries
-            cutoff_time = current_time - window_seconds
-            rate_limit_storage[client_ip] = [
-                timestamp for timestamp in rate_limit_storage.get(client_ip, [])
-                if timestamp > cutoff_time
-            ]
-            
-            # Check rate limit
-            if len(rate_limit_storage.get(client_ip, [])) >= max_requests:
+            # Check rate limit (the shared limiters evict and record in one call)
+            if smoothing:
+                allowed = token_bucket_limiter.is_allowed(client_ip, max_requests / window_seconds, max_requests)
+            else:
+                allowed, remaining, reset_at = rate_limiter.check(client_ip, max_requests, window_seconds)
+            if not allowed:
                 raise HTTPException(
                     status_code=429, 
-                    detail=f"Rate limit exceeded: {max_requests} requests per {window_seconds} seconds"
+                    detail=f"Rate limit exceeded: {max_requests} requests per {window_seconds} seconds",
+                    headers=None if smoothing else build_rate_limit_headers(max_requests, remaining, reset_at)
                 )
             
-            # Add current request
-            if client_ip not in rate_limit_storage:
-                rate_limit_storage[client_ip] = []
-            rate_limit_storage[client_ip].append(current_time)
-            
-            return await func(*args, **kwargs)
+            response = await func(*args, **kwargs)
+            if smoothing:
+                return response  # A token bucket has no window to report
+            # Plain return values are rendered here so the rate limit headers can go on the response
+            if not isinstance(response, Response):
+                response = UTF8JSONResponse(content=response)
+            response.headers.raw.extend(iter_rate_limit_headers(max_requests, remaining, reset_at))
+            return response
         return wrapper
     return decorator
 
-# Security headers middleware
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    
-    # Add security headers from config
-    for header, value in SecurityConfig.SECURITY_HEADERS.items():
-        response.headers[header] = value
-    
+# Analytics response cache (in production, use Redis or similar)
+# {cache_key: (expires_at, data_version, response)}
+ANALYTICS_CACHE_TTL = 30  # seconds
+ANALYTICS_CACHE_MAX_SIZE = 10000
+analytics_cache = {}
+
+def get_sessions_version(db: Session, *filters):
+    """Cheap fingerprint of the sessions behind an analytics response"""
+    row = db.query(
+        func.count(ChannelSession.id),
+        func.max(ChannelSession.leave_time),
+        func.max(ChannelSession.updated_at)
+    ).filter(*filters).first()
+    return tuple(row) if row else None
+
+def get_cached_analytics(cache_key, data_version):
+    """Return the cached response if it is still fresh and the data has not changed"""
+    entry = analytics_cache.get(cache_key)
+    if entry is None:
+        return None
+    expires_at, cached_version, response = entry
+    if expires_at < time.monotonic() or cached_version != data_version:
+        del analytics_cache[cache_key]
+        return None
     return response
 
+def set_cached_analytics(cache_key, data_version, response):
+    """Store an analytics response, evicting the oldest entry when full"""
+    if cache_key not in analytics_cache and len(analytics_cache) >= ANALYTICS_CACHE_MAX_SIZE:
+        del analytics_cache[next(iter(analytics_cache))]
+    analytics_cache[cache_key] = (time.monotonic() + ANALYTICS_CACHE_TTL, data_version, response)
+
+def make_etag(payload):
+    """Strong ETag for a JSON-serializable payload"""
+    digest = hashlib.blake2b(orjson.dumps(payload, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS), digest_size=8).hexdigest()
+    return f'"{digest}"'
+
+def etag_response(http_request: Request, payload, etag):
+    """Return 304 when the client already has this payload, otherwise the payload with its ETag"""
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return UTF8JSONResponse(content=payload, headers={"ETag": etag})
+
+def invalidate_export_channels(app_id: str, channel_name: str):
+    """Drop the cached export channel list when a committed session brings a channel it does not contain"""
+    entry = analytics_cache.get(("export_channels", app_id))
+    if entry is not None and channel_name not in entry[2][2]:
+        del analytics_cache[("export_channels", app_id)]
+
+# The batch worker reports channels after it commits new session rows in them
+webhook_processor.on_session_channel = invalidate_export_channels
+
+# Security headers middleware (pure ASGI, headers pre-encoded once)
+app.add_middleware(SecurityHeadersMiddleware)
+
 # Initialize database on startup
 create_tables()
 logger.info("Database tables created/verified")
@@ -362,7 +620,7 @@ logger.info("Database tables created/verified")
 templates = Jinja2Templates(directory="templates")
 
 @app.post("/{app_id}/webhooks")
-# @rate_limit(max_requests=1000, window_seconds=60)  # Temporarily disabled for testing
+# @rate_limit(max_requests=1000, window_seconds=60, smoothing=True)  # Temporarily disabled for testing
 async def receive_webhook(app_id: str, request: Request):
     """Receive webhook from Agora for specific App ID"""
     client_ip = request.client.host if request.client else "unknown"
@@ -380,25 +638,27 @@ async def receive_webhook(app_id: str, request: Request):
         body = await request.body()
         logger.debug(f"Webhook body length: {len(body)} bytes")
         
-        # Validate payload size
-        if not WebhookValidator.validate_payload_size(body.decode('utf-8')):
+        # Validate payload size on the raw bytes before decoding
+        if not WebhookValidator.validate_payload_size(body):
             logger.warning(f"Payload too large from {client_ip}")
             raise HTTPException(status_code=413, detail="Payload too large")
+        body_text = body.decode('utf-8')
         
         # Parse webhook data
         try:
-            webhook_data = WebhookRequest.parse_raw(body)
+            # Pydantic v2 parses JSON bytes directly without an intermediate dict
+            webhook_data = WebhookRequest.model_validate_json(body)
             logger.debug(f"Parsed webhook: noticeId={webhook_data.noticeId}, eventType={webhook_data.eventType}")
         except Exception as e:
             logger.error(f"Failed to parse webhook data from {client_ip}: {e}")
             logger.error(f"Raw body: {body.decode('utf-8', errors='ignore')[:500]}")
             raise HTTPException(status_code=400, detail="Invalid webhook data")
         
-        # Process webhook asynchronously
-        await webhook_processor.process_webhook(app_id, webhook_data, body.decode('utf-8'))
+        # Queue webhook for the batch worker
+        await webhook_processor.process_webhook(app_id, webhook_data, body_text)
         
-        logger.info(f"Webhook processed successfully for app_id: {app_id}, event_type: {webhook_data.eventType}, product_id: {webhook_data.productId}, platform: {webhook_data.payload.platform}, reason: {webhook_data.payload.reason}, from: {client_ip}")
-        return JSONResponse(content={"status": "success", "message": "Webhook processed"})
+        logger.info(f"Webhook queued successfully for app_id: {app_id}, event_type: {webhook_data.eventType}, product_id: {webhook_data.productId}, platform: {webhook_data.payload.platform}, reason: {webhook_data.payload.reason}, from: {client_ip}")
+        return JSONResponse(content={"status": "success", "message": "Webhook accepted"})
         
     except HTTPException as he:
         logger.error(f"HTTP error processing webhook from {client_ip} for app_id {app_id}: {he.detail}")
@@ -426,8 +686,6 @@ async def get_channels(
 ):
     """Get list of channels for an App ID with pagination and optional filters"""
     try:
-        from datetime import datetime, time as dt_time
-        
         # Log incoming filter parameters
         logger.info(f"get_channels called - app_id: {app_id}, page: {page}, per_page: {per_page}, "
                    f"start_date: {start_date}, end_date: {end_date}, platform: {platform}, "
@@ -452,10 +710,8 @@ async def get_channels(
                     start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
                     end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                     if start_dt.tzinfo is None:
-                        from datetime import timezone
                         start_dt = start_dt.replace(tzinfo=timezone.utc)
                     if end_dt.tzinfo is None:
-                        from datetime import timezone
                         end_dt = end_dt.replace(tzinfo=timezone.utc)
                     
                     # Convert to naive UTC for SQLite compatibility (SQLite stores datetimes as strings)
@@ -520,7 +776,6 @@ async def get_channels(
                 try:
                     start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
                     if start_dt.tzinfo is None:
-                        from datetime import timezone
                         start_dt = start_dt.replace(tzinfo=timezone.utc)
                     
                     # Convert to naive UTC for SQLite compatibility
@@ -556,7 +811,6 @@ async def get_channels(
                 try:
                     end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                     if end_dt.tzinfo is None:
-                        from datetime import timezone
                         end_dt = end_dt.replace(tzinfo=timezone.utc)
                     
                     # Convert to naive UTC for SQLite compatibility
@@ -665,10 +919,8 @@ async def get_channels(
                         test_start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
                         test_end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                         if test_start_dt.tzinfo is None:
-                            from datetime import timezone
                             test_start_dt = test_start_dt.replace(tzinfo=timezone.utc)
                         if test_end_dt.tzinfo is None:
-                            from datetime import timezone
                             test_end_dt = test_end_dt.replace(tzinfo=timezone.utc)
                         if test_start_dt.tzinfo:
                             test_start_dt = test_start_dt.replace(tzinfo=None)
@@ -721,10 +973,8 @@ async def get_channels(
                     test_start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
                     test_end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                     if test_start_dt.tzinfo is None:
-                        from datetime import timezone
                         test_start_dt = test_start_dt.replace(tzinfo=timezone.utc)
                     if test_end_dt.tzinfo is None:
-                        from datetime import timezone
                         test_end_dt = test_end_dt.replace(tzinfo=timezone.utc)
                     if test_start_dt.tzinfo:
                         test_start_dt = test_start_dt.replace(tzinfo=None)
@@ -807,16 +1057,16 @@ async def get_channels(
         if channel_sessions:
             logger.info(f"Sample channels returned (first 3): {[(s.channel_name, s.channel_session_id, s.first_activity, s.last_activity) for s in channel_sessions[:3]]}")
         
-        # Get client types for each channel session separately (SQLite compatible)
+        # Get client types for every channel session on this page in one query
         # Apply the same filters as the main query to ensure consistency
         channel_client_types = {}
-        for session in channel_sessions:
-            key = (session.channel_name, session.channel_session_id)
+        if channel_sessions:
             # Build filter for client_types query - apply same filters as main query
             client_type_filter = [
                 ChannelSession.app_id == app_id,
-                ChannelSession.channel_name == session.channel_name,
-                ChannelSession.channel_session_id == session.channel_session_id,
+                tuple_(ChannelSession.channel_name, ChannelSession.channel_session_id).in_(
+                    [(session.channel_name, session.channel_session_id) for session in channel_sessions]
+                ),
                 ChannelSession.client_type.isnot(None)
             ]
             
@@ -828,10 +1078,8 @@ async def get_channels(
                         start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
                         end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                         if start_dt.tzinfo is None:
-                            from datetime import timezone
                             start_dt = start_dt.replace(tzinfo=timezone.utc)
                         if end_dt.tzinfo is None:
-                            from datetime import timezone
                             end_dt = end_dt.replace(tzinfo=timezone.utc)
                         
                         # Convert to naive UTC for SQLite compatibility
@@ -882,7 +1130,6 @@ async def get_channels(
                     try:
                         start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
                         if start_dt.tzinfo is None:
-                            from datetime import timezone
                             start_dt = start_dt.replace(tzinfo=timezone.utc)
                         
                         # Convert to naive UTC for SQLite compatibility
@@ -912,7 +1159,6 @@ async def get_channels(
                     try:
                         end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
                         if end_dt.tzinfo is None:
-                            from datetime import timezone
                             end_dt = end_dt.replace(tzinfo=timezone.utc)
                         
                         # Convert to naive UTC for SQLite compatibility
@@ -954,10 +1200,15 @@ async def get_channels(
                 elif role.lower() == "audience":
                     client_type_filter.append(ChannelSession.is_host == False)
             
-            client_types = db.query(ChannelSession.client_type).filter(
+            client_types = db.query(
+                ChannelSession.channel_name,
+                ChannelSession.channel_session_id,
+                ChannelSession.client_type
+            ).filter(
                 and_(*client_type_filter)
             ).distinct().all()
-            channel_client_types[key] = [ct[0] for ct in client_types if ct[0] is not None]
+            for channel_name, channel_session_id, session_client_type in client_types:
+                channel_client_types.setdefault((channel_name, channel_session_id), []).append(session_client_type)
         
         channels = []
         for session in channel_sessions:
@@ -1061,9 +1312,23 @@ async def get_channel_details(app_id: str, channel_name: str, session_id: str =
             ).all()
             sessions_for_metrics = all_sessions
         
-        # Calculate total metrics from filtered sessions
-        total_minutes = sum(s.duration_seconds or 0 for s in sessions_for_metrics) / 60.0
-        unique_users = len(set(s.uid for s in sessions_for_metrics))
+        # Calculate total metrics from filtered sessions in a single pass
+        total_seconds = 0
+        host_seconds = 0
+        user_uids = set()
+        host_uids = set()
+        audience_uids = set()
+        for s in sessions_for_metrics:
+            duration = s.duration_seconds or 0
+            total_seconds += duration
+            user_uids.add(s.uid)
+            if s.is_host:
+                host_seconds += duration
+                host_uids.add(s.uid)
+            else:
+                audience_uids.add(s.uid)
+        total_minutes = total_seconds / 60.0
+        unique_users = len(user_uids)
         
         # Get role events for filtered sessions only (if session_id provided)
         if session_id:
@@ -1107,11 +1372,11 @@ async def get_channel_details(app_id: str, channel_name: str, session_id: str =
                     audience_minutes += a_min
         else:
             # Fallback: use session-based calculation
-            host_minutes = sum((s.duration_seconds or 0) for s in sessions_for_metrics if s.is_host) / 60.0
+            host_minutes = host_seconds / 60.0
             audience_minutes = total_minutes - host_minutes
         
-        unique_hosts = len(set(s.uid for s in sessions_for_metrics if s.is_host))
-        unique_audiences = len(set(s.uid for s in sessions_for_metrics if not s.is_host))
+        unique_hosts = len(host_uids)
+        unique_audiences = len(audience_uids)
         
         # Calculate channel metrics (wall time, user-minutes sum, utilization) from filtered sessions
         channel_duration_minutes = None
@@ -1119,19 +1384,12 @@ async def get_channel_details(app_id: str, channel_name: str, session_id: str =
         utilization = None
         
         if sessions_for_metrics:
-            # Find min join_time and max leave_time from filtered sessions
-            join_times = [s.join_time for s in sessions_for_metrics if s.join_time]
-            leave_times = [s.leave_time for s in sessions_for_metrics if s.leave_time and s.leave_time]
+            # Wall time from min join_time and max leave_time of the filtered sessions
+            channel_duration_minutes = calculate_wall_clock_minutes(sessions_for_metrics)
             
-            if join_times and leave_times:
-                min_join = min(join_times)
-                max_leave = max(leave_times)
-                channel_duration_seconds = (max_leave - min_join).total_seconds()
-                channel_duration_minutes = channel_duration_seconds / 60.0
-                
-                # Calculate utilization: user-minutes / wall-minutes
-                if channel_duration_minutes > 0:
-                    utilization = user_minutes_sum / channel_duration_minutes
+            # Calculate utilization: user-minutes / wall-minutes
+            if channel_duration_minutes and channel_duration_minutes > 0:
+                utilization = user_minutes_sum / channel_duration_minutes
         
         return ChannelDetailResponse(
             channel_name=channel_name,
@@ -1189,134 +1447,131 @@ async def get_user_metrics(app_id: str, uid: int, db: Session = Depends(get_db))
 async def get_user_detailed_analytics(app_id: str, uid: int, db: Session = Depends(get_db)):
     """Get detailed user analytics including role switches, platform distribution, and quality insights"""
     try:
-        # Get all sessions for this user
+        # Serve from cache when the user's sessions have not changed
+        cache_key = ("user_detailed", app_id, uid)
+        data_version = get_sessions_version(db, ChannelSession.app_id == app_id, ChannelSession.uid == uid)
+        cached_response = get_cached_analytics(cache_key, data_version)
+        if cached_response is not None:
+            return cached_response
+        
+        # Stream all sessions for this user (newest first) and fold every metric in a single pass
+        # so memory stays bounded for users with very large session histories
         sessions = db.query(ChannelSession).filter(
             ChannelSession.app_id == app_id,
             ChannelSession.uid == uid
-        ).order_by(desc(ChannelSession.join_time)).all()
-        
-        if not sessions:
-            raise HTTPException(status_code=404, detail="User not found")
+        ).order_by(desc(ChannelSession.join_time)).execution_options(stream_results=True).yield_per(5000)
         
-        # Calculate comprehensive metrics
-        total_channels_joined = len(set(s.channel_name for s in sessions))
-        total_active_minutes = sum(s.duration_seconds or 0 for s in sessions) / 60.0
-        total_role_switches = sum(s.role_switches or 0 for s in sessions)
-        
-        # Platform distribution
+        session_count = 0
+        total_seconds = 0
+        total_role_switches = 0
+        failed_calls = 0
         platform_counts = {}
+        reason_counts = {}
+        product_seconds = {}
+        # Per-channel accumulators: [total_seconds, session_count, role_switches, is_host, communication_mode, last_activity]
+        channel_stats = {}
+        sid = None
+        
         for session in sessions:
+            duration_seconds = session.duration_seconds or 0
+            role_switches = session.role_switches or 0
+            
+            session_count += 1
+            total_seconds += duration_seconds
+            total_role_switches += role_switches
+            if duration_seconds < 5:
+                failed_calls += 1
+            
+            # Platform distribution
             if session.platform:
                 platform_name = get_platform_name(session.platform)
                 platform_counts[platform_name] = platform_counts.get(platform_name, 0) + 1
+            
+            # Exit reason codes
+            reason_counts[session.reason] = reason_counts.get(session.reason, 0) + 1
+            
+            # Product breakdown
+            product_name = get_product_name(session.product_id)
+            product_seconds[product_name] = product_seconds.get(product_name, 0) + duration_seconds
+            
+            # Channels list with details
+            # Sessions arrive newest first, so the first session seen for a channel is the most recent one
+            stats = channel_stats.get(session.channel_name)
+            if stats is None:
+                # Use the communication_mode from the most recent session for this channel
+                stats = [0, 0, 0, False, session.communication_mode or 0, session.join_time]
+                channel_stats[session.channel_name] = stats
+            stats[0] += duration_seconds
+            stats[1] += 1
+            stats[2] += role_switches
+            # Host can be: broadcaster (communication_mode=0, is_host=True) OR communication host (communication_mode=1, is_host=True)
+            if session.is_host:
+                stats[3] = True
+            
+            # Most recent non-null SID
+            if sid is None and session.sid:
+                sid = session.sid
+        
+        if not session_count:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Calculate comprehensive metrics
+        total_channels_joined = len(channel_stats)
+        total_active_minutes = total_seconds / 60.0
         
         # Quality metrics based on reason codes
-        avg_session_length = total_active_minutes / len(sessions) if sessions else 0
+        avg_session_length = total_active_minutes / session_count
         
         # Categorize exits by reason codes
-        good_exits = len([s for s in sessions if s.reason == 1])  # Normal leave
-        network_timeouts = len([s for s in sessions if s.reason == 2])  # Connection timeout
-        permission_issues = len([s for s in sessions if s.reason == 3])  # Permissions issue
-        server_issues = len([s for s in sessions if s.reason == 4])  # Server load adjustment
-        device_switches = len([s for s in sessions if s.reason == 5])  # Device switch
-        ip_switching = len([s for s in sessions if s.reason == 9])  # Multiple IP addresses
-        network_issues = len([s for s in sessions if s.reason == 10])  # Network connection problems
-        churn_events = len([s for s in sessions if s.reason == 999])  # Abnormal user
-        other_issues = len([s for s in sessions if s.reason == 0])  # Other reasons
-        
-        failed_calls = len([s for s in sessions if (s.duration_seconds or 0) < 5])
-        spike_detection_score = churn_events / len(sessions) if sessions else 0
-        
-        # Product breakdown
-        product_breakdown = {}
-        for session in sessions:
-            product_name = get_product_name(session.product_id)
-            minutes = (session.duration_seconds or 0) / 60.0
-            product_breakdown[product_name] = product_breakdown.get(product_name, 0) + minutes
+        good_exits = reason_counts.get(1, 0)  # Normal leave
+        network_timeouts = reason_counts.get(2, 0)  # Connection timeout
+        permission_issues = reason_counts.get(3, 0)  # Permissions issue
+        server_issues = reason_counts.get(4, 0)  # Server load adjustment
+        device_switches = reason_counts.get(5, 0)  # Device switch
+        ip_switching = reason_counts.get(9, 0)  # Multiple IP addresses
+        network_issues = reason_counts.get(10, 0)  # Network connection problems
+        churn_events = reason_counts.get(999, 0)  # Abnormal user
+        other_issues = reason_counts.get(0, 0)  # Other reasons
         
-        # Channels list with details
-        channels_list = []
-        channel_stats = {}
-        for session in sessions:
-            channel = session.channel_name
-            if channel not in channel_stats:
-                channel_stats[channel] = {
-                    'total_minutes': 0,
-                    'session_count': 0,
-                    'role_switches': 0,
-                    'is_host': False,
-                    'communication_mode': 0,
-                    'last_activity': session.join_time
-                }
-            
-            channel_stats[channel]['total_minutes'] += (session.duration_seconds or 0) / 60.0
-            channel_stats[channel]['session_count'] += 1
-            channel_stats[channel]['role_switches'] += session.role_switches or 0
-            # Check if user was host/broadcaster
-            # Host can be: broadcaster (communication_mode=0, is_host=True) OR communication host (communication_mode=1, is_host=True)
-            if session.is_host:
-                channel_stats[channel]['is_host'] = True
-            # Use the communication_mode from the most recent session for this channel
-            if session.join_time > channel_stats[channel]['last_activity']:
-                channel_stats[channel]['communication_mode'] = session.communication_mode or 0
-                channel_stats[channel]['last_activity'] = session.join_time
-        
-        for channel, stats in channel_stats.items():
-            channels_list.append({
+        spike_detection_score = churn_events / session_count
+        
+        product_breakdown = {name: seconds / 60.0 for name, seconds in product_seconds.items()}
+        
+        channels_list = [
+            {
                 'channel_name': channel,
-                'total_minutes': round(stats['total_minutes'], 2),
-                'session_count': stats['session_count'],
-                'role_switches': stats['role_switches'],
-                'is_host': stats['is_host'],
-                'communication_mode': stats['communication_mode'],
-                'last_activity': stats['last_activity'].isoformat()
-            })
+                'total_minutes': round(stats[0] / 60.0, 2),
+                'session_count': stats[1],
+                'role_switches': stats[2],
+                'is_host': stats[3],
+                'communication_mode': stats[4],
+                'last_activity': stats[5].isoformat()
+            }
+            for channel, stats in channel_stats.items()
+        ]
         
         # Quality insights based on reason codes
-        quality_insights = []
-        
-        # High impact issues
-        if churn_events > 0:
-            quality_insights.append(f"🔴 User {uid} experienced {churn_events} abnormal leaves (reason=999) - frequent join/leave")
-        if other_issues > 0:
-            quality_insights.append(f"🔴 {other_issues} unknown issues (reason=0) - investigate further")
-        
-        # Medium impact issues
-        if network_timeouts > 0:
-            quality_insights.append(f"🟡 {network_timeouts} connection timeouts (reason=2) - network instability")
-        if network_issues > 0:
-            quality_insights.append(f"🟡 {network_issues} network connection problems (reason=10) - check connectivity")
-        if ip_switching > 0:
-            quality_insights.append(f"🟡 {ip_switching} IP switching events (reason=9) - VPN or multiple IPs detected")
-        if server_issues > 0:
-            quality_insights.append(f"🟡 {server_issues} server load adjustments (reason=4) - Agora server issues")
-        
-        # Low impact issues
-        if permission_issues > 0:
-            quality_insights.append(f"🟢 {permission_issues} permission issues (reason=3) - admin actions")
-        if device_switches > 0:
-            quality_insights.append(f"🟢 {device_switches} device switches (reason=5) - user behavior")
-        
-        # Good indicators
-        if good_exits > 0:
-            quality_insights.append(f"✅ {good_exits} normal exits (reason=1) - good user experience")
-        
-        # Other quality indicators
-        if failed_calls > 0:
-            quality_insights.append(f"📞 {failed_calls} failed calls detected (duration < 5s)")
-        if total_role_switches > 5:
-            quality_insights.append(f"🔄 High role switching activity: {total_role_switches} switches")
-        if avg_session_length < 1:
-            quality_insights.append(f"⏱️ Short average session length: {avg_session_length:.1f} minutes")
-        
-        # Collect SID from sessions - get the most recent non-null SID
-        sid = None
-        for session in sorted(sessions, key=lambda s: s.join_time, reverse=True):
-            if session.sid:
-                sid = session.sid
-                break
+        if reason_counts.keys() == {1} and not failed_calls and total_role_switches <= 5 and avg_session_length >= 1:
+            # Only normal exits and nothing else to flag: the good-exit insight is the only one
+            quality_insights = [GOOD_EXITS_INSIGHT.format(n=good_exits)]
+        else:
+            quality_insights = build_insights(USER_INSIGHT_RULES, {
+                'churn_events': churn_events,
+                'other_issues': other_issues,
+                'network_timeouts': network_timeouts,
+                'network_issues': network_issues,
+                'ip_switching': ip_switching,
+                'server_issues': server_issues,
+                'permission_issues': permission_issues,
+                'device_switches': device_switches,
+                'good_exits': good_exits,
+                'failed_calls': failed_calls,
+                'total_role_switches': total_role_switches
+            }, uid=uid)
+            if avg_session_length < 1:
+                quality_insights.append(f"⏱️ Short average session length: {avg_session_length:.1f} minutes")
         
-        return UserDetailResponse(
+        response = UserDetailResponse(
             uid=uid,
             app_id=app_id,
             total_channels_joined=total_channels_joined,
@@ -1332,6 +1587,8 @@ async def get_user_detailed_analytics(app_id: str, uid: int, db: Session = Depen
             quality_insights=quality_insights,
             sid=sid
         )
+        set_cached_analytics(cache_key, data_version, response)
+        return response
         
     except HTTPException:
         raise
@@ -1384,30 +1641,17 @@ async def get_channel_role_analytics(app_id: str, channel_name: str, session_id:
         total_role_switches = len(role_events) if role_events else sum(s.role_switches or 0 for s in sessions)
         
         # Calculate wall clock time (channel elapsed time) = max(leave) - min(join) for this channel_session_id
-        wall_clock_minutes = None
-        if sessions:
-            join_times = [s.join_time for s in sessions if s.join_time]
-            leave_times = [s.leave_time for s in sessions if s.leave_time and s.leave_time]
-            
-            if join_times and leave_times:
-                min_join = min(join_times)
-                max_leave = max(leave_times)
-                wall_clock_seconds = (max_leave - min_join).total_seconds()
-                wall_clock_minutes = wall_clock_seconds / 60.0
+        wall_clock_minutes = calculate_wall_clock_minutes(sessions)
         
-        # Product breakdown
+        # Product and platform breakdown in one pass
         product_breakdown = {}
+        platform_breakdown = {}
         for session in sessions:
-            product_name = get_product_name(session.product_id)
             minutes = (session.duration_seconds or 0) / 60.0
+            product_name = get_product_name(session.product_id)
             product_breakdown[product_name] = product_breakdown.get(product_name, 0) + minutes
-        
-        # Platform breakdown
-        platform_breakdown = {}
-        for session in sessions:
             if session.platform:
                 platform_name = get_platform_name(session.platform)
-                minutes = (session.duration_seconds or 0) / 60.0
                 platform_breakdown[platform_name] = platform_breakdown.get(platform_name, 0) + minutes
         
         return RoleAnalyticsResponse(
@@ -1432,16 +1676,29 @@ async def get_channel_quality_metrics(app_id: str, channel_name: str, session_id
     """Get quality and health indicators for a specific channel session"""
     try:
         # Get sessions for this channel, optionally filtered by session_id
-        query = db.query(ChannelSession).filter(
+        session_filters = [
             ChannelSession.app_id == app_id,
             ChannelSession.channel_name == channel_name
-        )
+        ]
         
         if session_id:
             # Filter by specific session if provided
-            query = query.filter(ChannelSession.channel_session_id == session_id)
-        
-        sessions = query.all()
+            session_filters.append(ChannelSession.channel_session_id == session_id)
+        
+        # Serve from cache when the channel's sessions have not changed
+        cache_key = ("quality_metrics", app_id, channel_name, session_id)
+        data_version = get_sessions_version(db, *session_filters)
+        cached_response = get_cached_analytics(cache_key, data_version)
+        if cached_response is not None:
+            return cached_response
+        
+        # The sessions and the reason-code pivot are independent, so run them concurrently
+        # (the pivot on the request's session, which already read the data version above)
+        reason_row, sessions = await run_queries_concurrently(
+            db,
+            lambda query_db: query_db.query(*reason_count_columns()).filter(*session_filters).one(),
+            lambda query_db: query_db.query(ChannelSession).filter(*session_filters).all()
+        )
         
         if not sessions:
             raise HTTPException(status_code=404, detail="Channel not found")
@@ -1450,115 +1707,61 @@ async def get_channel_quality_metrics(app_id: str, channel_name: str, session_id
         session_lengths = [s.duration_seconds or 0 for s in sessions]
         avg_user_session_length = sum(session_lengths) / len(session_lengths) / 60.0 if session_lengths else 0
         
-        # Session length histogram
-        histogram = {
-            "0-5s": len([s for s in session_lengths if s < 5]),
-            "5-30s": len([s for s in session_lengths if 5 <= s < 30]),
-            "30-60s": len([s for s in session_lengths if 30 <= s < 60]),
-            "1-5min": len([s for s in session_lengths if 60 <= s < 300]),
-            "5-15min": len([s for s in session_lengths if 300 <= s < 900]),
-            "15min+": len([s for s in session_lengths if s >= 900])
-        }
+        # Session length histogram (single pass, bucketed by upper bound)
+        bucket_counts = [0] * len(SESSION_LENGTH_LABELS)
+        for length in session_lengths:
+            bucket_counts[bisect_right(SESSION_LENGTH_BOUNDS, length)] += 1
+        histogram = dict(zip(SESSION_LENGTH_LABELS, bucket_counts))
         
-        # Quality indicators based on reason codes
+        # Quality indicators based on reason codes, pivoted in SQL
         # Good reasons (normal exits)
-        good_exits = len([s for s in sessions if s.reason == 1])  # Normal leave
+        good_exits = reason_row.good_exits or 0  # Normal leave
         
         # Network/connection issues (moderate quality impact)
-        network_timeouts = len([s for s in sessions if s.reason == 2])  # Connection timeout
-        network_issues = len([s for s in sessions if s.reason == 10])  # Network connection problems
-        ip_switching = len([s for s in sessions if s.reason == 9])  # Multiple IP addresses
+        network_timeouts = reason_row.network_timeouts or 0  # Connection timeout
+        network_issues = reason_row.network_issues or 0  # Network connection problems
+        ip_switching = reason_row.ip_switching or 0  # Multiple IP addresses
         
         # Server issues (moderate quality impact)
-        server_issues = len([s for s in sessions if s.reason == 4])  # Server load adjustment
+        server_issues = reason_row.server_issues or 0  # Server load adjustment
         
         # Permission/control issues (low quality impact)
-        permission_issues = len([s for s in sessions if s.reason == 3])  # Permissions issue
-        device_switches = len([s for s in sessions if s.reason == 5])  # Device switch
+        permission_issues = reason_row.permission_issues or 0  # Permissions issue
+        device_switches = reason_row.device_switches or 0  # Device switch
         
         # Poor quality indicators
-        churn_events = len([s for s in sessions if s.reason == 999])  # Abnormal user
-        other_issues = len([s for s in sessions if s.reason == 0])  # Other reasons
+        churn_events = reason_row.churn_events or 0  # Abnormal user
+        other_issues = reason_row.other_issues or 0  # Other reasons
         
         # Calculate total problematic exits
         problematic_exits = network_timeouts + network_issues + ip_switching + server_issues + churn_events + other_issues
         
-        failed_calls = len([s for s in sessions if (s.duration_seconds or 0) < 5])
-        test_channels = 1 if len(set(s.uid for s in sessions)) == 1 else 0
+        failed_calls = sum(1 for s in sessions if (s.duration_seconds or 0) < 5)
+        # A single-user channel is flagged as a test; stop at the first different UID instead of building a set
+        test_channels = 1 if sessions and all(s.uid == sessions[0].uid for s in sessions) else 0
         
         # Calculate max concurrent users from join/leave pairs
         max_concurrent_users, peak_concurrent_time, concurrency_over_time = calculate_max_concurrency(sessions)
         
-        # Calculate quality score (0-100) based on reason codes
-        quality_score = 100
-        
-        # High impact: Abnormal users and other issues
-        if churn_events > 0:
-            quality_score -= min(churn_events * 15, 60)  # High penalty for abnormal users
-        if other_issues > 0:
-            quality_score -= min(other_issues * 10, 40)  # High penalty for unknown issues
-        
-        # Medium impact: Network and server issues
-        network_issues_total = network_timeouts + network_issues + ip_switching
-        if network_issues_total > 0:
-            quality_score -= min(network_issues_total * 8, 35)  # Medium penalty for network issues
-        if server_issues > 0:
-            quality_score -= min(server_issues * 6, 25)  # Medium penalty for server issues
-        
-        # Low impact: Permission and device issues
-        control_issues = permission_issues + device_switches
-        if control_issues > 0:
-            quality_score -= min(control_issues * 3, 15)  # Low penalty for control issues
-        
-        # Failed calls (short duration)
-        if failed_calls > 0:
-            quality_score -= min(failed_calls * 5, 30)
-        
-        # Session length impact
-        if avg_user_session_length < 1:
-            quality_score -= 20
-        
-        # Bonus for good exits (if most exits are normal)
-        total_exits = len(sessions)
-        if total_exits > 0 and good_exits / total_exits > 0.7:
-            quality_score += 5  # Small bonus for mostly normal exits
+        counts = {
+            'churn_events': churn_events,
+            'other_issues': other_issues,
+            'network_timeouts': network_timeouts,
+            'network_issues': network_issues,
+            'ip_switching': ip_switching,
+            'server_issues': server_issues,
+            'permission_issues': permission_issues,
+            'device_switches': device_switches,
+            'good_exits': good_exits,
+            'failed_calls': failed_calls,
+            'test_channels': test_channels
+        }
         
-        quality_score = max(0, min(100, quality_score))  # Clamp between 0-100
+        # Calculate quality score (0-100) based on reason codes
+        quality_score = compute_quality_score(counts, avg_user_session_length, len(sessions))
         
         # Generate insights based on reason codes
-        insights = []
-        
-        # High impact issues
-        if churn_events > 0:
-            insights.append(f"🔴 {churn_events} abnormal user events (reason=999) - frequent join/leave")
-        if other_issues > 0:
-            insights.append(f"🔴 {other_issues} unknown issues (reason=0) - investigate further")
-        
-        # Medium impact issues
-        if network_timeouts > 0:
-            insights.append(f"🟡 {network_timeouts} connection timeouts (reason=2) - network instability")
-        if network_issues > 0:
-            insights.append(f"🟡 {network_issues} network connection problems (reason=10) - check connectivity")
-        if ip_switching > 0:
-            insights.append(f"🟡 {ip_switching} IP switching events (reason=9) - VPN or multiple IPs detected")
-        if server_issues > 0:
-            insights.append(f"🟡 {server_issues} server load adjustments (reason=4) - Agora server issues")
-        
-        # Low impact issues
-        if permission_issues > 0:
-            insights.append(f"🟢 {permission_issues} permission issues (reason=3) - admin actions")
-        if device_switches > 0:
-            insights.append(f"🟢 {device_switches} device switches (reason=5) - user behavior")
-        
-        # Good indicators
-        if good_exits > 0:
-            insights.append(f"✅ {good_exits} normal exits (reason=1) - good user experience")
-        
-        # Other quality indicators
-        if failed_calls > 0:
-            insights.append(f"📞 {failed_calls} failed calls (duration < 5s)")
-        if test_channels:
-            insights.append("🧪 Test channel detected (only 1 user)")
+        insights = build_insights(CHANNEL_INSIGHT_RULES, counts)
         if avg_user_session_length < 1:
             insights.append(f"⏱️ Short average session length: {avg_user_session_length:.1f} minutes")
         
@@ -1573,7 +1776,7 @@ async def get_channel_quality_metrics(app_id: str, channel_name: str, session_id
         # Convert tuples to lists for JSON serialization
         concurrency_data = [[ts, count] for ts, count in concurrency_over_time] if concurrency_over_time else None
         
-        return QualityMetricsResponse(
+        response = QualityMetricsResponse(
             channel_name=channel_name,
             avg_user_session_length=round(avg_user_session_length, 2),
             avg_join_to_media_time=0.0,  # Would need additional tracking
@@ -1587,6 +1790,8 @@ async def get_channel_quality_metrics(app_id: str, channel_name: str, session_id
             quality_score=round(quality_score, 1),
             insights=insights
         )
+        set_cached_analytics(cache_key, data_version, response)
+        return response
         
     except HTTPException:
         raise
@@ -1598,35 +1803,58 @@ async def get_channel_quality_metrics(app_id: str, channel_name: str, session_id
 async def get_channel_multi_user_analytics(app_id: str, channel_name: str, session_id: str = None, db: Session = Depends(get_db)):
     """Get multi-user analytics for a specific channel session"""
     try:
-        # Get sessions for this channel, optionally filtered by session_id
-        query = db.query(ChannelSession).filter(
+        # Filter sessions for this channel, optionally by session_id
+        session_filters = [
             ChannelSession.app_id == app_id,
             ChannelSession.channel_name == channel_name
-        )
+        ]
         
         if session_id:
             # Filter by specific session if provided
-            query = query.filter(ChannelSession.channel_session_id == session_id)
-        
-        sessions = query.all()
+            session_filters.append(ChannelSession.channel_session_id == session_id)
+        
+        # Per-user totals and reason-code counts, pivoted in SQL
+        duration = func.coalesce(ChannelSession.duration_seconds, 0)
+        # The session columns (only those needed for platform distribution and reconnection analysis)
+        # are fetched concurrently with the grouped query
+        user_rows, sessions = await run_queries_concurrently(
+            db,
+            lambda query_db: query_db.query(
+                ChannelSession.uid,
+                func.sum(duration).label('total_seconds'),
+                func.sum(func.coalesce(ChannelSession.role_switches, 0)).label('total_role_switches'),
+                func.count(func.distinct(ChannelSession.channel_name)).label('total_channels'),
+                func.count(ChannelSession.id).label('session_count'),
+                func.sum(case((duration < 5, 1), else_=0)).label('failed_calls'),  # Sessions < 5 seconds
+                *reason_count_columns()
+            ).filter(*session_filters).group_by(ChannelSession.uid).all(),
+            lambda query_db: query_db.query(
+                ChannelSession.uid,
+                ChannelSession.platform,
+                ChannelSession.channel_session_id,
+                ChannelSession.join_time,
+                ChannelSession.leave_time
+            ).filter(*session_filters).all()
+        )
         
-        if not sessions:
+        if not user_rows:
             raise HTTPException(status_code=404, detail="Channel not found")
         
         # Group sessions by user
         user_sessions = {}
         for session in sessions:
-            uid = session.uid
-            if uid not in user_sessions:
-                user_sessions[uid] = []
-            user_sessions[uid].append(session)
+            user_sessions.setdefault(session.uid, []).append(session)
         
         # Calculate analytics for each user
         user_analytics = []
-        for uid, user_session_list in user_sessions.items():
-            total_minutes = sum((s.duration_seconds or 0) for s in user_session_list) / 60.0
-            total_channels = len(set(s.channel_name for s in user_session_list))
-            total_role_switches = sum(s.role_switches or 0 for s in user_session_list)
+        for row in user_rows:
+            uid = row.uid
+            user_session_list = user_sessions.get(uid, [])
+            
+            total_minutes = (row.total_seconds or 0) / 60.0
+            total_channels = row.total_channels
+            total_role_switches = row.total_role_switches or 0
+            failed_calls = row.failed_calls or 0
             
             # Platform distribution
             platform_dist = {}
@@ -1634,71 +1862,45 @@ async def get_channel_multi_user_analytics(app_id: str, channel_name: str, sessi
                 platform = session.platform or 'Unknown'
                 platform_dist[platform] = platform_dist.get(platform, 0) + 1
             
-            # Failed calls (sessions < 5 seconds)
-            failed_calls = len([s for s in user_session_list if (s.duration_seconds or 0) < 5])
-            
             # Comprehensive reason code analysis per user
-            good_exits = len([s for s in user_session_list if s.reason == 1])  # Normal leave
-            network_timeouts = len([s for s in user_session_list if s.reason == 2])  # Connection timeout
-            permission_issues = len([s for s in user_session_list if s.reason == 3])  # Permissions issue
-            server_issues = len([s for s in user_session_list if s.reason == 4])  # Server load adjustment
-            device_switches = len([s for s in user_session_list if s.reason == 5])  # Device switch
-            ip_switching = len([s for s in user_session_list if s.reason == 9])  # Multiple IP addresses
-            network_issues = len([s for s in user_session_list if s.reason == 10])  # Network connection problems
-            churn_events = len([s for s in user_session_list if s.reason == 999])  # Abnormal user
-            other_issues = len([s for s in user_session_list if s.reason == 0])  # Other reasons
+            good_exits = row.good_exits or 0
+            network_timeouts = row.network_timeouts or 0
+            permission_issues = row.permission_issues or 0
+            server_issues = row.server_issues or 0
+            device_switches = row.device_switches or 0
+            ip_switching = row.ip_switching or 0
+            network_issues = row.network_issues or 0
+            churn_events = row.churn_events or 0
+            other_issues = row.other_issues or 0
             
             # Analyze reconnection patterns and burst behavior
             reconnection_analysis = analyze_user_reconnection_patterns(user_session_list, uid)
             
-            # Calculate user quality score
-            user_quality_score = 100
-            
-            # High impact issues
-            if churn_events > 0:
-                user_quality_score -= min(churn_events * 15, 60)
-            if other_issues > 0:
-                user_quality_score -= min(other_issues * 10, 40)
-            
-            # Medium impact issues
-            network_issues_total = network_timeouts + network_issues + ip_switching
-            if network_issues_total > 0:
-                user_quality_score -= min(network_issues_total * 8, 35)
-            if server_issues > 0:
-                user_quality_score -= min(server_issues * 6, 25)
-            
-            # Low impact issues
-            control_issues = permission_issues + device_switches
-            if control_issues > 0:
-                user_quality_score -= min(control_issues * 3, 15)
-            
-            # Failed calls
-            if failed_calls > 0:
-                user_quality_score -= min(failed_calls * 5, 30)
-            
             # Reconnection pattern impact
             if reconnection_analysis['reconnection_pattern'] == 'unstable':
-                user_quality_score -= 25  # High penalty for unstable connections
+                reconnection_penalty = 25  # High penalty for unstable connections
             elif reconnection_analysis['reconnection_pattern'] == 'moderate':
-                user_quality_score -= 15  # Medium penalty for moderate reconnections
+                reconnection_penalty = 15  # Medium penalty for moderate reconnections
             elif reconnection_analysis['rapid_reconnections'] > 0:
-                user_quality_score -= 10  # Light penalty for any rapid reconnections
-            
-            # Burst behavior impact
-            if reconnection_analysis['burst_sessions'] > 0:
-                user_quality_score -= min(reconnection_analysis['burst_sessions'] * 5, 20)
-            
-            # Session length impact
-            avg_session_length = total_minutes / len(user_session_list) if user_session_list else 0
-            if avg_session_length < 1:
-                user_quality_score -= 20
-            
-            # Bonus for good exits
-            total_exits = len(user_session_list)
-            if total_exits > 0 and good_exits / total_exits > 0.7:
-                user_quality_score += 5
+                reconnection_penalty = 10  # Light penalty for any rapid reconnections
+            else:
+                reconnection_penalty = 0
             
-            user_quality_score = max(0, min(100, user_quality_score))
+            # Calculate user quality score
+            avg_session_length = total_minutes / row.session_count if row.session_count else 0
+            user_quality_score = compute_quality_score({
+                'churn_events': churn_events,
+                'other_issues': other_issues,
+                'network_timeouts': network_timeouts,
+                'network_issues': network_issues,
+                'ip_switching': ip_switching,
+                'server_issues': server_issues,
+                'permission_issues': permission_issues,
+                'device_switches': device_switches,
+                'good_exits': good_exits,
+                'failed_calls': failed_calls,
+                'burst_sessions': reconnection_analysis['burst_sessions']
+            }, avg_session_length, row.session_count, extra_penalty=reconnection_penalty)
             
             user_analytics.append({
                 'uid': uid,
@@ -1739,7 +1941,6 @@ async def get_channel_multi_user_analytics(app_id: str, channel_name: str, sessi
 
 def get_platform_name(platform_id: int) -> str:
     """Convert platform ID to readable name"""
-    from mappings import PLATFORM_MAPPING
     return PLATFORM_MAPPING.get(platform_id, f"Platform {platform_id}")
 
 def get_product_name(product_id: int) -> str:
@@ -1774,33 +1975,58 @@ async def debug_cache():
         logger.error(f"Error getting cache stats: {e}")
         return {"error": "Failed to get cache stats"}
 
+def prepare_export_request(app_id: str, request_body: ExportRequest) -> ExportRequest:
+    """Fill in an export's default date range and validate it (shared by the export and its HEAD count)"""
+    # Set the app_id from the URL path
+    request_body.app_id = app_id
+    
+    # Default to the last 7 days, filling in whichever bound is missing
+    if not request_body.end_date:
+        request_body.end_date = datetime.utcnow()
+    if not request_body.start_date:
+        request_body.start_date = request_body.end_date - timedelta(days=7)
+    
+    # Validate export request for security
+    validation_result = ExportSecurity.validate_export_request(request_body.model_dump())
+    if not validation_result['valid']:
+        raise HTTPException(status_code=400, detail=f"Export validation failed: {', '.join(validation_result['errors'])}")
+    
+    # Use sanitized data (only rebuild the model when the sanitizer changed something)
+    if validation_result['warnings']:
+        request_body = ExportRequest(**validation_result['sanitized_data'])
+    return request_body
+
+@app.head("/api/export/{app_id}")
+@rate_limit(max_requests=10, window_seconds=60)  # Shares the export's budget
+async def head_export(
+    app_id: str,
+    http_request: Request,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    channel_name: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Report the record count of an export (X-Total-Records) without generating it"""
+    try:
+        request_body = prepare_export_request(
+            app_id, ExportRequest(app_id=app_id, start_date=start_date, end_date=end_date, channel_name=channel_name)
+        )
+        
+        total_records = ExportService(db).count_records(request_body)
+        return Response(headers={"X-Total-Records": str(total_records)})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error counting export records for app_id {app_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @app.post("/api/export/{app_id}")
 @rate_limit(max_requests=10, window_seconds=60)  # 10 exports per minute
 async def export_data(app_id: str, request_body: ExportRequest, http_request: Request, db: Session = Depends(get_db)):
     """Export data for a specific App ID with optional filters"""
     try:
-        # Set the app_id from the URL path
-        request_body.app_id = app_id
-        
-        # Parse string dates to datetime objects if they're strings
-        if isinstance(request_body.start_date, str):
-            request_body.start_date = datetime.fromisoformat(request_body.start_date.replace('Z', '+00:00'))
-        if isinstance(request_body.end_date, str):
-            request_body.end_date = datetime.fromisoformat(request_body.end_date.replace('Z', '+00:00'))
-        
-        # Validate export request for security
-        validation_result = ExportSecurity.validate_export_request(request_body.dict())
-        if not validation_result['valid']:
-            raise HTTPException(status_code=400, detail=f"Export validation failed: {', '.join(validation_result['errors'])}")
-        
-        # Use sanitized data
-        request_body = ExportRequest(**validation_result['sanitized_data'])
-        
-        # Validate request
-        if not request_body.start_date and not request_body.end_date:
-            # Default to last 7 days if no date range provided
-            request_body.start_date = datetime.utcnow() - timedelta(days=7)
-            request_body.end_date = datetime.utcnow()
+        request_body = prepare_export_request(app_id, request_body)
         
         # Create export service
         export_service = ExportService(db)
@@ -1812,30 +2038,32 @@ async def export_data(app_id: str, request_body: ExportRequest, http_request: Re
         total_records = export_result.get('export_info', {}).get('total_records', 0) or export_result.get('total_records', 0)
         logger.info(f"Export completed for app_id {app_id}: {total_records} records")
         
-        # Handle CSV export (zip file) - check for both zip_file (regular) and zip_content (chunked)
+        # Handle CSV export (zip file) - check for both zip_file (regular) and zip_stream (chunked)
         if request_body.format.lower() == "csv":
             if "zip_file" in export_result:
                 zip_data = export_result["zip_file"]
-                filename = f"agora_export_{app_id}_{request_body.start_date.strftime('%Y%m%d')}_to_{request_body.end_date.strftime('%Y%m%d')}.zip"
+                filename = f"agora_export_{app_id}_{request_body.start_date:%Y%m%d}_to_{request_body.end_date:%Y%m%d}.zip"
                 total_records = export_result.get('export_info', {}).get('total_records', 0)
                 return Response(
                     content=zip_data,
                     media_type="application/zip",
                     headers={
                         "Content-Disposition": f"attachment; filename={filename}",
+                        "Content-Encoding": "identity",  # Already deflated - keep GZipMiddleware off it
                         "X-Total-Records": str(total_records)
                     }
                 )
-            elif "zip_content" in export_result:
-                # Handle chunked export
-                zip_data = export_result["zip_content"]
-                filename = export_result.get("filename", f"agora_export_{app_id}_{request_body.start_date.strftime('%Y%m%d')}_to_{request_body.end_date.strftime('%Y%m%d')}.zip")
+            elif "zip_stream" in export_result:
+                # Handle chunked export - streamed while the archive is written instead of buffered
+                # Only format the fallback name when the service did not provide one
+                filename = export_result.get("filename") or f"agora_export_{app_id}_{request_body.start_date:%Y%m%d}_to_{request_body.end_date:%Y%m%d}.zip"
                 total_records = export_result.get('total_records', 0)
-                return Response(
-                    content=zip_data,
+                return StreamingResponse(
+                    export_result["zip_stream"],
                     media_type="application/zip",
                     headers={
                         "Content-Disposition": f"attachment; filename={filename}",
+                        "Content-Encoding": "identity",  # Already deflated - keep GZipMiddleware off it
                         "X-Total-Records": str(total_records)
                     }
                 )
@@ -1843,6 +2071,8 @@ async def export_data(app_id: str, request_body: ExportRequest, http_request: Re
         # Handle JSON export
         return export_result
         
+    except HTTPException:
+        raise
     except ValueError as e:
         logger.error(f"Export validation error for app_id {app_id}: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -1850,51 +2080,79 @@ async def export_data(app_id: str, request_body: ExportRequest, http_request: Re
         logger.error(f"Error exporting data for app_id {app_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+DISTINCT_CHANNELS_QUERY = text("""
+    WITH RECURSIVE channel_names(channel_name) AS (
+        SELECT MIN(channel_name) FROM channel_sessions WHERE app_id = :app_id
+        UNION ALL
+        SELECT (
+            SELECT MIN(channel_name) FROM channel_sessions
+            WHERE app_id = :app_id AND channel_name > channel_names.channel_name
+        )
+        FROM channel_names
+        WHERE channel_names.channel_name IS NOT NULL
+    )
+    SELECT channel_name FROM channel_names WHERE channel_name IS NOT NULL
+""")
+
 @app.get("/api/export/{app_id}/channels")
-async def get_export_channels(app_id: str, db: Session = Depends(get_db)):
+async def get_export_channels(app_id: str, http_request: Request, db: Session = Depends(get_db)):
     """Get list of channels available for export for a specific App ID"""
     try:
-        # Get unique channels for the app
-        channels = db.query(ChannelSession.channel_name).filter(
-            ChannelSession.app_id == app_id
-        ).distinct().all()
-        
-        channel_list = [{"channel_name": channel[0]} for channel in channels]
+        cache_key = ("export_channels", app_id)
+        cached = get_cached_analytics(cache_key, None)
+        if cached is None:
+            # Get unique channels for the app with a loose index scan over (app_id, channel_name, ...):
+            # each step seeks to the next channel name instead of reading every session row
+            channels = db.execute(DISTINCT_CHANNELS_QUERY, {"app_id": app_id}).all()
+            
+            channel_list = [{"channel_name": channel[0]} for channel in channels]
+            
+            payload = {
+                "app_id": app_id,
+                "channels": channel_list,
+                "total_channels": len(channel_list)
+            }
+            # Channel names are kept so webhook ingestion can invalidate on a new channel
+            cached = (payload, make_etag(payload), frozenset(channel[0] for channel in channels))
+            set_cached_analytics(cache_key, None, cached)
         
-        return {
-            "app_id": app_id,
-            "channels": channel_list,
-            "total_channels": len(channel_list)
-        }
+        return etag_response(http_request, cached[0], cached[1])
         
     except Exception as e:
         logger.error(f"Error getting export channels for app_id {app_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/api/export/{app_id}/date-range")
-async def get_export_date_range(app_id: str, db: Session = Depends(get_db)):
+async def get_export_date_range(app_id: str, http_request: Request, db: Session = Depends(get_db)):
     """Get available date range for export for a specific App ID"""
     try:
-        # Get date range from webhook events
-        date_range = db.query(
-            func.min(WebhookEvent.received_at).label('earliest'),
-            func.max(WebhookEvent.received_at).label('latest')
-        ).filter(WebhookEvent.app_id == app_id).first()
-        
-        if not date_range or not date_range.earliest:
-            return {
-                "app_id": app_id,
-                "earliest_date": None,
-                "latest_date": None,
-                "message": "No data available for export"
-            }
+        cache_key = ("export_date_range", app_id)
+        cached = get_cached_analytics(cache_key, None)
+        if cached is None:
+            # Get date range from webhook events
+            date_range = db.query(
+                func.min(WebhookEvent.received_at).label('earliest'),
+                func.max(WebhookEvent.received_at).label('latest')
+            ).filter(WebhookEvent.app_id == app_id).first()
+            
+            if not date_range or not date_range.earliest:
+                payload = {
+                    "app_id": app_id,
+                    "earliest_date": None,
+                    "latest_date": None,
+                    "message": "No data available for export"
+                }
+            else:
+                payload = {
+                    "app_id": app_id,
+                    "earliest_date": date_range.earliest.isoformat(),
+                    "latest_date": date_range.latest.isoformat(),
+                    "total_days": (date_range.latest - date_range.earliest).days + 1
+                }
+            cached = (payload, make_etag(payload))
+            set_cached_analytics(cache_key, None, cached)
         
-        return {
-            "app_id": app_id,
-            "earliest_date": date_range.earliest.isoformat(),
-            "latest_date": date_range.latest.isoformat(),
-            "total_days": (date_range.latest - date_range.earliest).days + 1
-        }
+        return etag_response(http_request, cached[0], cached[1])
         
     except Exception as e:
         logger.error(f"Error getting export date range for app_id {app_id}: {e}")
@@ -1907,12 +2165,6 @@ async def validate_export_request(app_id: str, request_body: ExportRequest, db:
         # Set the app_id from the URL path
         request_body.app_id = app_id
         
-        # Parse string dates to datetime objects if they're strings
-        if isinstance(request_body.start_date, str):
-            request_body.start_date = datetime.fromisoformat(request_body.start_date.replace('Z', '+00:00'))
-        if isinstance(request_body.end_date, str):
-            request_body.end_date = datetime.fromisoformat(request_body.end_date.replace('Z', '+00:00'))
-        
         # Create export service
         export_service = ExportService(db)
         
@@ -1930,23 +2182,16 @@ async def create_public_share(app_id: str, request_body: ExportRequest, db: Sess
     """Create a public share URL for filtered data"""
     try:
         # Set the app_id from the URL path
-        request.app_id = app_id
-        
-        # Parse string dates to datetime objects if they're strings
-        if isinstance(request.start_date, str):
-            request.start_date = datetime.fromisoformat(request.start_date.replace('Z', '+00:00'))
-        if isinstance(request.end_date, str):
-            request.end_date = datetime.fromisoformat(request.end_date.replace('Z', '+00:00'))
+        request_body.app_id = app_id
         
         # Create export service
         export_service = ExportService(db)
         
         # Generate a share token (in production, this would be stored in database)
-        import secrets
-        share_token = secrets.token_urlsafe(32)
+        share_token = share_token_pool.token_urlsafe()
         
         # Create public share URL
-        share_url = export_service.create_public_share_url(request, share_token)
+        share_url = export_service.create_public_share_url(request_body, share_token)
         
         return {
             "share_url": share_url,
@@ -2028,11 +2273,17 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
             query_start_date = request_body.start_date
             query_end_date = request_body.end_date
         
-        # Build query - include sessions that overlap the date range
+        # Session times are stored naive (UTC), so bring the query range into the same form once
+        if query_start_date.tzinfo is not None:
+            query_start_date = query_start_date.astimezone(timezone.utc).replace(tzinfo=None)
+        if query_end_date.tzinfo is not None:
+            query_end_date = query_end_date.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        # Build filters - include sessions that overlap the date range
         # A session overlaps if: join_time <= query_end_date AND leave_time >= query_start_date
         # For sessions without leave_time (incomplete), include if they started before or during query range
         # (they overlap the query range since they're still active)
-        query = db.query(ChannelSession).filter(
+        session_filters = [
             ChannelSession.app_id == app_id,
             ChannelSession.duration_seconds.isnot(None),
             or_(
@@ -2050,7 +2301,7 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
                     ChannelSession.join_time <= query_end_date  # Started before or during query range
                 )
             )
-        )
+        ]
         
         # Apply client type filter first to determine if we need to adjust platform filter
         # Handle None/null values specially - filter for NULL client_type (only for Linux platform)
@@ -2073,7 +2324,7 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
             platform_filter_list = [6]
         
         if platform_filter_list:
-            query = query.filter(ChannelSession.platform.in_(platform_filter_list))
+            session_filters.append(ChannelSession.platform.in_(platform_filter_list))
         
         # Apply client type filter (multi-select)
         if request_body.client_types and len(request_body.client_types) > 0:
@@ -2098,7 +2349,7 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
                 filter_conditions.append(ChannelSession.client_type.in_(regular_values))
             
             if filter_conditions:
-                query = query.filter(or_(*filter_conditions))
+                session_filters.append(or_(*filter_conditions))
         
         # Apply role filter (multi-select)
         if request_body.role and len(request_body.role) > 0:
@@ -2109,223 +2360,130 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
             if "audience" in request_body.role:
                 role_filters.append(ChannelSession.is_host == False)
             if role_filters:
-                query = query.filter(or_(*role_filters))
+                session_filters.append(or_(*role_filters))
         
-        sessions = query.all()
+        # Series dimension: platform + client_type, or role + client_type (default)
+        # The role label is computed in SQL so rows arrive carrying their final series key
+        if request_body.breakdown_by == "platform":
+            series_column = ChannelSession.platform.label('series_value')
+        else:
+            series_column = case((ChannelSession.is_host == True, 'host'), else_='audience').label('series_value')
+        
+        # Completed sessions that start and end on the same day (the common case) are summed per day in SQL
+        session_day = func.date(ChannelSession.join_time)
+        single_day = and_(
+            ChannelSession.leave_time.isnot(None),
+            ChannelSession.duration_seconds > 0,
+            session_day == func.date(ChannelSession.leave_time)
+        )
+        single_day_rows = db.query(
+            session_day.label('day'),
+            series_column,
+            ChannelSession.client_type,
+            func.sum(ChannelSession.duration_seconds).label('total_seconds')
+        ).filter(*session_filters, single_day).group_by(session_day, series_column, ChannelSession.client_type).all()
+        
+        # Only multi-day and still-active sessions need to be split across days in Python
+        # Only the columns the splitter reads, as plain rows instead of ORM objects
+        sessions = db.query(
+            ChannelSession.join_time,
+            ChannelSession.leave_time,
+            ChannelSession.duration_seconds,
+            series_column,
+            ChannelSession.client_type
+        ).filter(*session_filters, ~single_day).all()
         
         # Debug logging for None client type sessions
+        none_groups = sum(1 for row in single_day_rows if row.client_type is None)
         none_sessions = [s for s in sessions if s.client_type is None]
-        logger.info(f"Minutes analytics query: Found {len(sessions)} total sessions, {len(none_sessions)} with None client_type")
-        if none_sessions:
-            sample_dates = {}
-            for s in none_sessions[:50]:  # Increased sample size
-                date_key = s.join_time.date().strftime("%Y-%m-%d")
-                if date_key not in sample_dates:
-                    sample_dates[date_key] = {'host': 0, 'audience': 0, 'total_minutes': 0.0, 'count': 0}
-                sample_dates[date_key]['count'] += 1
-                sample_dates[date_key]['total_minutes'] += (s.duration_seconds or 0) / 60.0
-                if s.is_host:
-                    sample_dates[date_key]['host'] += 1
-                else:
-                    sample_dates[date_key]['audience'] += 1
-            logger.info(f"None client_type sessions breakdown by date: {sample_dates}")
+        logger.info(f"Minutes analytics query: Found {len(single_day_rows)} single-day groups ({none_groups} with None client_type), "
+                    f"{len(sessions)} multi-day/active sessions ({len(none_sessions)} with None client_type)")
         
         # Aggregate by period and breakdown dimension
         period_format = "%Y-%m-%d" if request_body.period == "day" else "%Y-%m"
         
-        # Group data by series key based on breakdown_by option
+        # Group data by series key based on breakdown_by
         # If breakdown_by == "role": group by (role, client_type)
         # If breakdown_by == "platform": group by (platform, client_type)
-        series_data = {}
+        series_data = defaultdict(lambda: defaultdict(float))
         
-        # Get all unique combinations
-        from mappings import get_client_type_name, get_platform_name
+        # Only count days that fall within the query date range
+        query_start_date_only = query_start_date.date()
+        query_end_date_only = query_end_date.date()
         
-        for session in sessions:
-            # Get client type
-            client_type = session.client_type
-            platform = session.platform
+        # Period key for every day in the range, formatted once and looked up by day index
+        day_count = max(0, (query_end_date_only - query_start_date_only).days + 1)
+        day_keys = [(query_start_date_only + timedelta(days=day_index)).strftime(period_format) for day_index in range(day_count)]
+        
+        for day, series_value, client_type, total_seconds in single_day_rows:
+            # SQLite returns DATE() as an ISO string, other backends as a date
+            if isinstance(day, str):
+                day = datetime.strptime(day, "%Y-%m-%d").date()
             
-            # Determine series key based on breakdown_by
-            if request_body.breakdown_by == "platform":
-                # Group by platform + client_type
-                series_key = (platform, client_type)
-            else:
-                # Default: group by role + client_type
-                # This includes None/empty client_type as a separate category
-                role = "host" if session.is_host else "audience"
-                series_key = (role, client_type)
+            series_key = (series_value, client_type)
             
-            # Initialize series if needed
-            if series_key not in series_data:
-                series_data[series_key] = {}
+            # Accessing the series creates it, so series without in-range minutes still show up
+            series_dates = series_data[series_key]
+            if query_start_date_only <= day <= query_end_date_only:
+                series_dates[day_keys[(day - query_start_date_only).days]] += (total_seconds or 0) / 60.0
+        
+        # Multi-day/active sessions become (series index, start, end) spans in epoch microseconds
+        first_day_us = to_epoch_us(datetime.combine(query_start_date_only, dt_time.min))
+        query_end_us = to_epoch_us(query_end_date)
+        series_keys = []
+        series_indexes = {}
+        spans = []
+        
+        for join_time, leave_time, duration_seconds, series_value, client_type in sessions:
+            # (platform or role, client_type) - None/empty client_type is its own category
+            series_key = (series_value, client_type)
             
-            # Split session duration across days if it spans multiple days
-            if session.join_time and session.leave_time and session.duration_seconds:
-                join_date = session.join_time.date()
-                leave_date = session.leave_time.date()
-                
-                # Only count days that fall within the query date range
-                query_start_date_only = query_start_date.date()
-                query_end_date_only = query_end_date.date()
-                
-                if join_date == leave_date:
-                    # Session is entirely within one day
-                    # Only count if this day overlaps the query range
-                    if query_start_date_only <= join_date <= query_end_date_only:
-                        # Check if session actually overlaps query time range
-                        # For single-day sessions, check if session overlaps query datetime range
-                        session_start = session.join_time
-                        session_end = session.leave_time
-                        
-                        # Normalize timezones for comparison
-                        # If query dates are naive, make them aware; if session times are naive, make them aware
-                        if query_start_date.tzinfo is None and session_start.tzinfo is not None:
-                            # Query dates are naive, session is aware - make query dates aware (UTC)
-                            from datetime import timezone
-                            query_start_normalized = query_start_date.replace(tzinfo=timezone.utc)
-                            query_end_normalized = query_end_date.replace(tzinfo=timezone.utc)
-                        elif query_start_date.tzinfo is not None and session_start.tzinfo is None:
-                            # Query dates are aware, session is naive - make session aware (UTC)
-                            from datetime import timezone
-                            session_start = session_start.replace(tzinfo=timezone.utc)
-                            session_end = session_end.replace(tzinfo=timezone.utc)
-                            query_start_normalized = query_start_date
-                            query_end_normalized = query_end_date
-                        else:
-                            # Both are same type (both naive or both aware)
-                            query_start_normalized = query_start_date
-                            query_end_normalized = query_end_date
-                        
-                        # Session overlaps if it starts before query ends and ends after query starts
-                        if session_start <= query_end_normalized and session_end >= query_start_normalized:
-                            date_key = join_date.strftime(period_format)
-                            if date_key not in series_data[series_key]:
-                                series_data[series_key][date_key] = 0.0
-                            series_data[series_key][date_key] += (session.duration_seconds or 0) / 60.0
-                else:
-                    # Session spans multiple days - split duration proportionally
-                    join_datetime = session.join_time
-                    leave_datetime = session.leave_time
-                    total_duration_seconds = session.duration_seconds
-                    
-                    # Calculate minutes for each day, but only count days within query range
-                    current_date = join_date
-                    while current_date <= leave_date:
-                        # Skip days outside the query range
-                        if current_date < query_start_date_only or current_date > query_end_date_only:
-                            current_date += timedelta(days=1)
-                            continue
-                        
-                        # Calculate the start and end of this day (00:00:00 to 23:59:59.999999)
-                        from datetime import time as dt_time
-                        day_start = datetime.combine(current_date, dt_time(0, 0, 0))
-                        day_end = datetime.combine(current_date, dt_time(23, 59, 59, 999999))
-                        
-                        # Normalize timezones - ensure day_start/day_end match join_datetime timezone
-                        if join_datetime.tzinfo:
-                            day_start = day_start.replace(tzinfo=join_datetime.tzinfo)
-                            day_end = day_end.replace(tzinfo=join_datetime.tzinfo)
-                        elif day_start.tzinfo is None:
-                            # Both are naive, ensure they stay naive
-                            pass
-                        
-                        # Determine the actual session time range for this day
-                        # Use the intersection of session time and day boundaries
-                        # Don't clamp to query boundaries here - we've already filtered days
-                        session_start = max(join_datetime, day_start)
-                        session_end = min(leave_datetime, day_end)
-                        
-                        # Calculate duration in this day
-                        if session_start < session_end:
-                            day_duration_seconds = (session_end - session_start).total_seconds()
-                            day_minutes = day_duration_seconds / 60.0
-                            
-                            date_key = current_date.strftime(period_format)
-                            if date_key not in series_data[series_key]:
-                                series_data[series_key][date_key] = 0.0
-                            series_data[series_key][date_key] += day_minutes
-                        
-                        # Move to next day
-                        current_date += timedelta(days=1)
-            else:
+            series_index = series_indexes.get(series_key)
+            if series_index is None:
+                series_index = series_indexes[series_key] = len(series_keys)
+                series_keys.append(series_key)
+            
+            # Split session duration across days (single-day completed sessions were summed in SQL)
+            if join_time and leave_time and duration_seconds:
+                # Session spans multiple days - only days within the query range are visited
+                spans.append((series_index, to_epoch_us(join_time), to_epoch_us(leave_time)))
+            elif join_time:
                 # Handle incomplete sessions (no leave_time) - split across days like multi-day sessions
-                if session.join_time:
-                    join_date = session.join_time.date()
-                    join_datetime = session.join_time
-                    
-                    # Only count days that fall within the query date range
-                    query_start_date_only = query_start_date.date()
-                    query_end_date_only = query_end_date.date()
-                    
-                    # For incomplete sessions, use query_end_date as the effective end time
-                    # (session is still active, so count up to end of query range or end of day)
-                    effective_end_datetime = query_end_date
-                    if join_datetime.tzinfo and query_end_date.tzinfo is None:
-                        from datetime import timezone
-                        effective_end_datetime = query_end_date.replace(tzinfo=timezone.utc)
-                    elif join_datetime.tzinfo is None and query_end_date.tzinfo:
-                        effective_end_datetime = query_end_date.replace(tzinfo=None)
-                    
-                    # Calculate minutes for each day from join_date to query_end_date
-                    current_date = join_date
-                    while current_date <= query_end_date_only:
-                        # Skip days outside the query range
-                        if current_date < query_start_date_only or current_date > query_end_date_only:
-                            current_date += timedelta(days=1)
-                            continue
-                        
-                        # Calculate the start and end of this day
-                        from datetime import time as dt_time
-                        day_start = datetime.combine(current_date, dt_time(0, 0, 0))
-                        day_end = datetime.combine(current_date, dt_time(23, 59, 59, 999999))
-                        
-                        # Normalize timezones
-                        if join_datetime.tzinfo:
-                            day_start = day_start.replace(tzinfo=join_datetime.tzinfo)
-                            day_end = day_end.replace(tzinfo=join_datetime.tzinfo)
-                        
-                        # Determine the actual session time range for this day
-                        # For incomplete sessions, use join_time to min(day_end, effective_end_datetime)
-                        session_start = max(join_datetime, day_start)
-                        session_end = min(effective_end_datetime, day_end)
-                        
-                        # Calculate duration in this day
-                        if session_start < session_end:
-                            day_duration_seconds = (session_end - session_start).total_seconds()
-                            day_minutes = day_duration_seconds / 60.0
-                            
-                            date_key = current_date.strftime(period_format)
-                            if date_key not in series_data[series_key]:
-                                series_data[series_key][date_key] = 0.0
-                            series_data[series_key][date_key] += day_minutes
-                        
-                        # Move to next day
-                        current_date += timedelta(days=1)
-                else:
-                    # No join_time either - skip this session
-                    pass
+                # For incomplete sessions, use query_end_date as the effective end time
+                # (session is still active, so count up to end of query range or end of day)
+                spans.append((series_index, to_epoch_us(join_time), query_end_us))
         
-        # Generate all date keys for the period
-        all_date_keys = []
+        # Split the spans into one day bucket list per series
+        if len(spans) >= PARALLEL_SPLIT_MIN_SPANS and split_executor is not None:
+            series_buckets = await split_spans_parallel(spans, len(series_keys), day_count, first_day_us)
+        else:
+            series_buckets = split_spans_into_buckets(spans, len(series_keys), day_count, first_day_us)
+        
+        # Fold the day buckets into the period keys
+        for series_key, buckets in zip(series_keys, series_buckets):
+            series_dates = series_data[series_key]
+            for day_index, minutes in enumerate(buckets):
+                if minutes:
+                    series_dates[day_keys[day_index]] += minutes
+        
+        # Generate all date keys for the period (both walks are monotonic, so the keys come out unique and sorted)
+        # Kept as parallel lists: chart-order keys and their display labels
+        date_key_order = []
+        display_dates = []
         if request_body.period == "day":
-            current_date = request_body.start_date.date()
-            end_date = request_body.end_date.date()
-            while current_date <= end_date:
-                date_key = current_date.strftime(period_format)
-                display_date = current_date.strftime("%b %d, %Y")
-                all_date_keys.append({"date": date_key, "display_date": display_date})
-                current_date += timedelta(days=1)
+            start_day = request_body.start_date.date()
+            for day_offset in range((request_body.end_date.date() - start_day).days + 1):
+                current_date = start_day + timedelta(days=day_offset)
+                date_key_order.append(current_date.strftime(period_format))
+                display_dates.append(current_date.strftime("%b %d, %Y"))
         else:
             # For monthly, iterate through all months from normalized start to normalized end
             current_date = query_start_date.date().replace(day=1)
             end_date_obj = query_end_date.date()
             
             while current_date <= end_date_obj:
-                month_key = current_date.strftime(period_format)
-                if month_key not in [d["date"] for d in all_date_keys]:
-                    month_name = current_date.strftime("%B %Y")
-                    all_date_keys.append({"date": month_key, "display_date": month_name})
+                date_key_order.append(current_date.strftime(period_format))
+                display_dates.append(current_date.strftime("%B %Y"))
                 
                 # Move to next month
                 if current_date.month == 12:
@@ -2333,8 +2491,30 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
                 else:
                     current_date = current_date.replace(month=current_date.month + 1, day=1)
         
-        # Sort date keys
-        all_date_keys.sort(key=lambda x: x["date"])
+        # Build filters dict
+        filters = {
+            "platforms": request_body.platforms,
+            "client_types": request_body.client_types,
+            "role": request_body.role,
+            "breakdown_by": request_body.breakdown_by
+        }
+        
+        # No matching sessions: every period is zero and there are no series to assemble
+        if not series_data:
+            response = MinutesAnalyticsResponse(
+                app_id=app_id,
+                start_date=request_body.start_date,
+                end_date=request_body.end_date,
+                period=request_body.period,
+                total_minutes=0.0,
+                data_points=[
+                    {"date": date_key, "minutes": 0.0, "display_date": display_date}
+                    for date_key, display_date in zip(date_key_order, display_dates)
+                ],
+                filters=filters,
+                series=[]
+            )
+            return Response(content=response.model_dump_json(), media_type=UTF8JSONResponse.media_type)
         
         # Build series with data points
         series_list = []
@@ -2344,10 +2524,13 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
             '#a8edea', '#fed6e3', '#ff9a9e', '#fecfef', '#fecfef'
         ]
         
+        # The breakdown is fixed for the request, so decide it once rather than per series
+        is_platform_breakdown = request_body.breakdown_by == "platform"
+        
         # Sort series keys, handling None values
         def sort_key(item):
             key = item[0]
-            if request_body.breakdown_by == "platform":
+            if is_platform_breakdown:
                 platform, client_type = key
                 return (platform or 0, client_type if client_type is not None else -1)  # Use -1 for None to sort separately from 0
             else:
@@ -2357,11 +2540,12 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
         sorted_series = sorted(series_data.items(), key=sort_key)
         
         series_index = 0
+        total_minutes = 0.0  # Running total across all series
         for series_key, date_data in sorted_series:
             # Build label based on breakdown_by
-            if request_body.breakdown_by == "platform":
+            if is_platform_breakdown:
                 platform, client_type = series_key
-                platform_name = get_platform_name(platform) if platform else None
+                platform_name = get_mapped_platform_name(platform) if platform else None
                 # Check if client_type is None (not just falsy - 0 is valid!)
                 if client_type is not None:
                     client_type_name = get_client_type_name(client_type)
@@ -2390,27 +2574,18 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
                 else:
                     label = f"{role_label} - None"
             
-            # Build data points for this series
-            data_points = []
-            for date_info in all_date_keys:
-                date_key = date_info["date"]
-                minutes = round(date_data.get(date_key, 0.0), 2)
-                data_points.append(minutes)
+            # Build data points for this series, rounding only the populated cells (empty periods are 0.0)
+            rounded_minutes = {date_key: round(minutes, 2) for date_key, minutes in date_data.items()}
+            data_points = [rounded_minutes.get(date_key, 0.0) for date_key in date_key_order]
             
             # Calculate total for this series
             series_total = sum(data_points)
             
-            # Debug logging for None client type series
-            if request_body.breakdown_by == "platform":
-                platform, client_type = series_key
-                if client_type is None:
-                    logger.info(f"Series with None client_type (platform breakdown): key={series_key}, label={label}, total={series_total}, "
-                              f"sample_dates={[(all_date_keys[i]['date'], dp) for i, dp in enumerate(data_points) if dp > 0][:5]}")
-            else:
-                role, client_type = series_key
-                if client_type is None:
-                    logger.info(f"Series with None client_type (role breakdown): key={series_key}, label={label}, total={series_total}, "
-                              f"sample_dates={[(all_date_keys[i]['date'], dp) for i, dp in enumerate(data_points) if dp > 0][:5]}")
+            # Debug logging for None client type series (skipped entirely when INFO is disabled)
+            if client_type is None and logger.isEnabledFor(logging.INFO):
+                logger.info("Series with None client_type (%s breakdown): key=%s, label=%s, total=%s, sample_dates=%s",
+                            "platform" if is_platform_breakdown else "role", series_key, label, series_total,
+                            list(islice(((date_key, dp) for date_key, dp in zip(date_key_order, data_points) if dp > 0), 5)))
             
             # Only include series with data
             if series_total > 0:
@@ -2421,48 +2596,36 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
                     "color": color_palette[series_index % len(color_palette)]
                 }
                 
-                # Add dimension-specific fields
-                if request_body.breakdown_by == "platform":
-                    platform, client_type = series_key
+                # Add dimension-specific fields (names were already resolved for the label)
+                if is_platform_breakdown:
                     series_info["platform"] = platform
-                    series_info["platform_name"] = get_platform_name(platform) if platform else None
-                    series_info["client_type"] = client_type
-                    series_info["client_type_name"] = get_client_type_name(client_type) if client_type is not None else None
+                    series_info["platform_name"] = platform_name
                 else:
-                    role, client_type = series_key
                     series_info["role"] = role
-                    series_info["client_type"] = client_type
-                    series_info["client_type_name"] = get_client_type_name(client_type) if client_type is not None else None
+                series_info["client_type"] = client_type
+                series_info["client_type_name"] = client_type_name if client_type is not None else None
                 
                 series_list.append(series_info)
                 series_index += 1
-        
-        # Calculate total minutes across all series
-        total_minutes = sum(s["total_minutes"] for s in series_list)
+                total_minutes += series_info["total_minutes"]
         
         # Build data_points for backward compatibility (total across all series)
-        data_points = []
-        for date_info in all_date_keys:
-            date_key = date_info["date"]
-            total_for_date = sum(
-                series_data.get(key, {}).get(date_key, 0.0)
-                for key in series_data.keys()
-            )
-            data_points.append({
-                "date": date_key,
-                "minutes": round(total_for_date, 2),
-                "display_date": date_info["display_date"]
-            })
+        # One pass over the populated cells instead of a lookup per (date, series) pair
+        date_totals = defaultdict(float)
+        for date_data in series_data.values():
+            for date_key, minutes in date_data.items():
+                date_totals[date_key] += minutes
         
-        # Build filters dict
-        filters = {
-            "platforms": request_body.platforms,
-            "client_types": request_body.client_types,
-            "role": request_body.role,
-            "breakdown_by": request_body.breakdown_by
-        }
+        data_points = [
+            {
+                "date": date_key,
+                "minutes": round(date_totals.get(date_key, 0.0), 2),
+                "display_date": display_date
+            }
+            for date_key, display_date in zip(date_key_order, display_dates)
+        ]
         
-        return MinutesAnalyticsResponse(
+        response = MinutesAnalyticsResponse(
             app_id=app_id,
             start_date=request_body.start_date,
             end_date=request_body.end_date,
@@ -2472,6 +2635,9 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
             filters=filters,
             series=series_list
         )
+        # Serialize the validated model straight to JSON bytes in pydantic-core, skipping
+        # FastAPI's response_model re-validation and intermediate jsonable dict
+        return Response(content=response.model_dump_json(), media_type=UTF8JSONResponse.media_type)
         
     except Exception as e:
         logger.error(f"Error getting minutes analytics for app_id {app_id}: {e}")
@@ -2480,23 +2646,22 @@ async def get_minutes_analytics(app_id: str, request: Request, db: Session = Dep
 @app.get("/api/mappings/platforms")
 async def get_platform_mapping():
     """Get platform ID to name mapping"""
-    from mappings import PLATFORM_MAPPING
-    return {"platform_mapping": PLATFORM_MAPPING}
+    return {"platform_mapping": dict(PLATFORM_MAPPING)}
 
 @app.get("/api/analytics/platforms/{app_id}")
 async def get_platforms_for_app(app_id: str, db: Session = Depends(get_db)):
     """Get available platforms for an app"""
     try:
-        platforms = db.query(ChannelSession.platform).filter(
-            ChannelSession.app_id == app_id,
-            ChannelSession.platform.isnot(None)
-        ).distinct().all()
+        # Read from the per-app dimension summary instead of scanning every session
+        platforms = db.query(AppDimensionSummary.platform).filter(
+            AppDimensionSummary.app_id == app_id,
+            AppDimensionSummary.platform.isnot(None)
+        ).distinct().order_by(AppDimensionSummary.platform).all()
         
-        platform_list = [p[0] for p in platforms if p[0] is not None]
-        platform_list.sort()
+        # Already non-null and ordered by the database
+        platform_list = [p[0] for p in platforms]
         
         # Get names from mappings
-        from mappings import PLATFORM_MAPPING
         platforms_with_names = [
             {
                 "id": pid,
@@ -2518,20 +2683,20 @@ async def get_platforms_for_app(app_id: str, db: Session = Depends(get_db)):
 async def get_client_types_for_app(app_id: str, platform_id: int = None, db: Session = Depends(get_db)):
     """Get available client types for an app, optionally filtered by platform"""
     try:
-        query = db.query(ChannelSession.client_type).filter(
-            ChannelSession.app_id == app_id,
-            ChannelSession.client_type.isnot(None)
+        # Read from the per-app dimension summary instead of scanning every session
+        query = db.query(AppDimensionSummary.client_type).filter(
+            AppDimensionSummary.app_id == app_id,
+            AppDimensionSummary.client_type.isnot(None)
         )
         
         if platform_id:
-            query = query.filter(ChannelSession.platform == platform_id)
+            query = query.filter(AppDimensionSummary.platform == platform_id)
         
-        client_types = query.distinct().all()
-        client_type_list = [ct[0] for ct in client_types if ct[0] is not None]
-        client_type_list.sort()
+        client_types = query.distinct().order_by(AppDimensionSummary.client_type).all()
+        # Already non-null and ordered by the database
+        client_type_list = [ct[0] for ct in client_types]
         
         # Get names from mappings
-        from mappings import get_client_type_name
         client_types_with_names = [
             {
                 "id": ct,
@@ -2,8 +2,14 @@
 Mapping utilities for Agora webhook values
 """
 
+import logging
+from functools import lru_cache
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
 # Platform mappings from Agora documentation
-PLATFORM_MAPPING = {
+PLATFORM_MAPPING = MappingProxyType({
     0: "Other",
     1: "Android",
     2: "iOS", 
@@ -11,18 +17,21 @@ PLATFORM_MAPPING = {
     6: "Linux",
     7: "Web",
     8: "macOS"
-}
+})
+
+# Platform names indexed by platform ID (None for unassigned IDs)
+_PLATFORM_NAMES = tuple(PLATFORM_MAPPING.get(platform_id) for platform_id in range(max(PLATFORM_MAPPING) + 1))
 
 # Product ID mappings
-PRODUCT_ID_MAPPING = {
+PRODUCT_ID_MAPPING = MappingProxyType({
     1: "Realtime Communication (RTC)",
     3: "Cloud Recording", 
     4: "Media Pull",
     5: "Media Push"
-}
+})
 
 # Client Type mappings (used across all platforms/products)
-CLIENT_TYPE_MAPPING = {
+CLIENT_TYPE_MAPPING = MappingProxyType({
     3: "Local Recording",
     8: "Applets", 
     10: "Cloud Recording",
@@ -34,18 +43,22 @@ CLIENT_TYPE_MAPPING = {
     50: "Media Gateway",
     60: "Conversational AI",
     68: "Real-Time STT"
-}
+})
 
+@lru_cache(maxsize=256)  # Small integer domain, called per series/row
 def get_client_type_name(client_type_id):
     """Get client type name from client type ID"""
     return CLIENT_TYPE_MAPPING.get(client_type_id, f"Client Type {client_type_id}")
 
+@lru_cache(maxsize=256)  # Small integer domain, called per series/row
 def get_platform_name(platform_id, client_type=None):
     """Get platform name from platform ID, optionally with client type for Linux"""
     if platform_id is None:
         return "N/A"
     
-    platform_name = PLATFORM_MAPPING.get(platform_id, str(platform_id))
+    platform_name = _PLATFORM_NAMES[platform_id] if 0 <= platform_id < len(_PLATFORM_NAMES) else None
+    if platform_name is None:
+        platform_name = str(platform_id)
     
     # If it's Linux (6) and we have a client type, append it
     if platform_id == 6 and client_type is not None:
@@ -54,6 +67,7 @@ def get_platform_name(platform_id, client_type=None):
     
     return platform_name
 
+@lru_cache(maxsize=256)  # Small integer domain, called per series/row
 def get_product_name(product_id):
     """Get product name from product ID"""
     if product_id is None:
@@ -62,9 +76,6 @@ def get_product_name(product_id):
 
 def log_unknown_values(platform_id, product_id, event_type, channel_name):
     """Log unknown platform/product ID values for future mapping"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     if platform_id and platform_id not in PLATFORM_MAPPING:
         logger.warning(f"Unknown platform ID: {platform_id} for event {event_type} in channel {channel_name}")
     
@@ -101,25 +101,6 @@ class ExportRequest(BaseModel):
     include_sessions: bool = True
     include_metrics: bool = True
     
-    @field_validator('start_date', 'end_date', mode='before')
-    @classmethod
-    def parse_datetime_strings(cls, v):
-        """Parse datetime strings from JSON"""
-        if v is None:
-            return None
-        if isinstance(v, str):
-            # Handle ISO format with Z timezone
-            v = v.replace('Z', '+00:00')
-            try:
-                return datetime.fromisoformat(v)
-            except ValueError:
-                # Try parsing as ISO format without timezone
-                try:
-                    return datetime.fromisoformat(v.replace('+00:00', ''))
-                except ValueError:
-                    raise ValueError(f"Invalid date format: {v}")
-        return v
-    
     class Config:
         # Allow datetime strings to be parsed automatically
         json_encoders = {
@@ -216,25 +197,6 @@ class MinutesAnalyticsRequest(BaseModel):
             return result if result else None  # Return None if empty list
         return v
     
-    @field_validator('start_date', 'end_date', mode='before')
-    @classmethod
-    def parse_datetime_strings(cls, v):
-        """Parse datetime strings from JSON"""
-        if v is None:
-            return None
-        if isinstance(v, str):
-            # Handle ISO format with Z timezone
-            v = v.replace('Z', '+00:00')
-            try:
-                return datetime.fromisoformat(v)
-            except ValueError:
-                # Try parsing as ISO format without timezone
-                try:
-                    return datetime.fromisoformat(v.replace('+00:00', ''))
-                except ValueError:
-                    raise ValueError(f"Invalid date format: {v}")
-        return v
-    
     class Config:
         # Allow datetime strings to be parsed automatically
         json_encoders = {
@@ -2,12 +2,21 @@
 Security configuration and utilities for Agora Webhooks Server
 """
 
-import hashlib
-import hmac
+import base64
+import os
+import re
+import threading
 import time
-from typing import Optional, Dict, Any
+import uuid
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Optional, Dict, Any, Iterator, List, Tuple, Union
 from datetime import datetime, timedelta
 
+from fastapi import HTTPException
+
+from config import Config
+
 class SecurityConfig:
     """Security configuration settings"""
     
@@ -16,6 +25,11 @@ class SecurityConfig:
     API_RATE_LIMIT = 100       # requests per minute
     EXPORT_RATE_LIMIT = 10     # exports per minute
     
+    # In-memory limiter housekeeping
+    RATE_LIMIT_MAX_WINDOW = 60          # longest window in use, seconds
+    RATE_LIMIT_SWEEP_INTERVAL = 60      # seconds between idle-key sweeps
+    RATE_LIMIT_SHARDS = 16              # in-memory limiter shards (power of two)
+    
     # Export limits
     MAX_EXPORT_RECORDS = 100000
     MAX_EXPORT_DAYS = 30
@@ -44,74 +58,298 @@ class SecurityConfig:
 class RateLimiter:
     """Simple in-memory rate limiter (use Redis in production)"""
     
-    def __init__(self):
-        self.storage: Dict[str, list] = {}
+    def __init__(self, max_keys: int = 10000, shard_count: int = SecurityConfig.RATE_LIMIT_SHARDS):
+        # Per-key request timestamps, oldest first, split across shards by key hash.
+        # Each shard keeps its keys in least-recently-used order and has its own lock,
+        # so all state for one key lives under one lock and one dict.
+        self.shard_mask = shard_count - 1
+        self.shards: List["OrderedDict[str, deque]"] = [OrderedDict() for _ in range(shard_count)]
+        self.locks = [threading.Lock() for _ in range(shard_count)]
+        self.max_keys_per_shard = max(1, max_keys // shard_count)
+    
+    def _trim(self, window: deque, cutoff_time: float):
+        """Drop expired timestamps from the front of a window"""
+        while window and window[0] <= cutoff_time:
+            window.popleft()
+    
+    def check(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int, int]:
+        """Record a request if it is allowed; returns (allowed, remaining, reset_at)"""
+        # Windows use the monotonic clock so wall-clock jumps can't expire or revive entries
+        current_time = time.monotonic()
+        cutoff_time = current_time - window_seconds
+        reset_at = int(time.time() + window_seconds)
+        
+        index = hash(key) & self.shard_mask
+        shard = self.shards[index]
+        with self.locks[index]:
+            # Clean old entries
+            window = shard.get(key)
+            if window is None:
+                window = shard[key] = deque()
+                # Bound memory by forgetting the shard's least recently seen key
+                if len(shard) > self.max_keys_per_shard:
+                    shard.popitem(last=False)
+            else:
+                shard.move_to_end(key)
+                self._trim(window, cutoff_time)
+            
+            # Check if under limit
+            if len(window) >= max_requests:
+                return False, 0, reset_at
+            
+            # Add current request
+            window.append(current_time)
+            return True, max_requests - len(window), reset_at
     
     def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
         """Check if request is allowed based on rate limit"""
-        current_time = time.time()
+        return self.check(key, max_requests, window_seconds)[0]
+    
+    def get_remaining_requests(self, key: str, max_requests: int, window_seconds: int) -> int:
+        """Get remaining requests in current window"""
+        current_time = time.monotonic()
         cutoff_time = current_time - window_seconds
         
-        # Clean old entries
-        if key in self.storage:
-            self.storage[key] = [
-                timestamp for timestamp in self.storage[key]
-                if timestamp > cutoff_time
-            ]
-        else:
-            self.storage[key] = []
+        index = hash(key) & self.shard_mask
+        with self.locks[index]:
+            window = self.shards[index].get(key)
+            if window is not None:
+                self._trim(window, cutoff_time)
+                return max(0, max_requests - len(window))
         
-        # Check if under limit
-        if len(self.storage[key]) >= max_requests:
+        return max_requests
+    
+    def sweep(self, max_window_seconds: int) -> int:
+        """Forget keys with no request inside the longest window; returns how many were dropped"""
+        cutoff_time = time.monotonic() - max_window_seconds
+        dropped = 0
+        # One shard at a time, so requests on other shards are never blocked
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                idle_keys = [key for key, window in shard.items() if not window or window[-1] <= cutoff_time]
+                for key in idle_keys:
+                    del shard[key]
+            dropped += len(idle_keys)
+        return dropped
+
+class TokenBucketLimiter:
+    """In-memory token bucket: two numbers per key, O(1) per request, for smoothing rather than strict windows"""
+    
+    def __init__(self):
+        # key -> [tokens, last_refill_monotonic]
+        self.buckets: Dict[str, list] = {}
+        self.lock = threading.Lock()
+    
+    def is_allowed(self, key: str, rate_per_second: float, burst: int) -> bool:
+        """Refill the key's bucket for the elapsed time and spend one token if available"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(burst), now]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate_per_second)
+                bucket[1] = now
+            
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
             return False
-        
-        # Add current request
-        self.storage[key].append(current_time)
-        return True
+    
+    def sweep(self, max_window_seconds: int) -> int:
+        """Forget buckets idle long enough to have refilled; returns how many were dropped"""
+        cutoff_time = time.monotonic() - max_window_seconds
+        with self.lock:
+            idle_keys = [key for key, bucket in self.buckets.items() if bucket[1] <= cutoff_time]
+            for key in idle_keys:
+                del self.buckets[key]
+        return len(idle_keys)
+
+class RedisRateLimiter:
+    """Sliding-window rate limiter shared across workers, one Redis sorted set per key"""
+    
+    # Trim the window, count it and record the request in one atomic round trip.
+    # Returns the remaining requests after this one, or -1 when the request is rejected.
+    ALLOW_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+local count = redis.call('ZCARD', KEYS[1])
+if count >= tonumber(ARGV[3]) then
+    return -1
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+redis.call('PEXPIRE', KEYS[1], ARGV[5])
+return tonumber(ARGV[3]) - count - 1
+"""
+    
+    # Trim the window and count it without recording a request
+    REMAINING_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+return math.max(0, tonumber(ARGV[2]) - redis.call('ZCARD', KEYS[1]))
+"""
+    
+    def __init__(self, client):
+        self.client = client
+        self.allow_script = client.register_script(self.ALLOW_SCRIPT)
+        self.remaining_script = client.register_script(self.REMAINING_SCRIPT)
+    
+    def check(self, key: str, max_requests: int, window_seconds: int) -> Tuple[bool, int, int]:
+        """Record a request if it is allowed; returns (allowed, remaining, reset_at)"""
+        now_ms = int(time.time() * 1000)
+        window_ms = window_seconds * 1000
+        remaining = int(self.allow_script(
+            keys=[f"rl:{key}"],
+            args=[now_ms - window_ms, now_ms, max_requests, uuid.uuid4().hex, window_ms]
+        ))
+        return remaining >= 0, max(0, remaining), (now_ms + window_ms) // 1000
+    
+    def is_allowed(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        """Check if request is allowed based on rate limit"""
+        return self.check(key, max_requests, window_seconds)[0]
     
     def get_remaining_requests(self, key: str, max_requests: int, window_seconds: int) -> int:
         """Get remaining requests in current window"""
-        current_time = time.time()
-        cutoff_time = current_time - window_seconds
+        now_ms = int(time.time() * 1000)
+        return int(self.remaining_script(keys=[f"rl:{key}"], args=[now_ms - window_seconds * 1000, max_requests]))
+    
+    def sweep(self, max_window_seconds: int) -> int:
+        """Idle keys expire in Redis on their own (PEXPIRE), so there is nothing to sweep"""
+        return 0
+
+class TokenPool:
+    """URL-safe random tokens vended from one os.urandom read instead of a syscall per token"""
+    
+    def __init__(self, token_bytes: int = 32, pool_bytes: int = 4096):
+        self.token_bytes = token_bytes
+        self.pool_bytes = pool_bytes
+        self.pool = b""
+        self.offset = 0
+    
+    def token_urlsafe(self) -> str:
+        """Return a token with the same entropy and format as secrets.token_urlsafe(token_bytes)"""
+        if self.offset + self.token_bytes > len(self.pool):
+            self.pool = os.urandom(self.pool_bytes)
+            self.offset = 0
+        chunk = self.pool[self.offset:self.offset + self.token_bytes]
+        self.offset += self.token_bytes
+        return base64.urlsafe_b64encode(chunk).rstrip(b"=").decode("ascii")
+
+# Potentially dangerous characters stripped by WebhookValidator.sanitize_input
+SANITIZE_DELETE_TABLE = str.maketrans('', '', '<>"\'&;()|`$')
+
+# Letters, digits, '-' and '_', with at least one letter or digit
+APP_ID_PATTERN = re.compile(r'[-_]*[^\W_][\w-]*')
+
+# Security headers as raw ASGI (name, value) byte pairs, encoded once
+SECURITY_HEADERS_RAW = tuple(
+    (name.lower().encode("latin-1"), value.encode("latin-1"))
+    for name, value in SecurityConfig.SECURITY_HEADERS.items()
+)
+SECURITY_HEADER_NAMES = frozenset(name for name, _ in SECURITY_HEADERS_RAW)
+
+class SecurityHeadersMiddleware:
+    """ASGI middleware that adds SecurityConfig.SECURITY_HEADERS to every HTTP response"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        if key in self.storage:
-            self.storage[key] = [
-                timestamp for timestamp in self.storage[key]
-                if timestamp > cutoff_time
-            ]
-            return max(0, max_requests - len(self.storage[key]))
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Configured values replace any the endpoint set itself
+                headers = [header for header in message.get("headers", []) if header[0] not in SECURITY_HEADER_NAMES]
+                headers.extend(SECURITY_HEADERS_RAW)
+                message["headers"] = headers
+            await send(message)
         
-        return max_requests
+        await self.app(scope, receive, send_with_headers)
+
+class MaxBodySizeMiddleware:
+    """ASGI middleware that rejects request bodies over max_size with 413 before they are read"""
+    
+    def __init__(self, app, max_size: int = SecurityConfig.MAX_PAYLOAD_SIZE):
+        self.app = app
+        self.max_size = max_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Declared length: reject without touching the body
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_size:
+                    await self._reject(send)
+                    return
+                break
+        
+        # Chunked (or understated) bodies: count bytes as the app reads them
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise HTTPException(status_code=413, detail="Payload too large")
+            return message
+        
+        await self.app(scope, limited_receive, send)
+    
+    async def _reject(self, send):
+        """Send a 413 response"""
+        body = b'{"detail":"Payload too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))]
+        })
+        await send({"type": "http.response.body", "body": body})
 
 class WebhookValidator:
     """Webhook payload validation and security checks"""
     
     @staticmethod
-    def validate_payload_size(payload: str, max_size: int = SecurityConfig.MAX_PAYLOAD_SIZE) -> bool:
-        """Validate webhook payload size"""
-        return len(payload.encode('utf-8')) <= max_size
+    def validate_payload_size(payload: Union[bytes, str], max_size: int = SecurityConfig.MAX_PAYLOAD_SIZE) -> bool:
+        """Validate webhook payload size in bytes (pass the raw request body to avoid re-encoding)"""
+        if isinstance(payload, str):
+            # A UTF-8 character is at most 4 bytes, so only borderline strings need encoding
+            if len(payload) * 4 <= max_size:
+                return True
+            payload = payload.encode('utf-8')
+        return len(payload) <= max_size
     
     @staticmethod
+    @lru_cache(maxsize=512)
     def validate_app_id(app_id: str) -> bool:
         """Validate App ID format"""
         if not app_id or len(app_id) < 10:
             return False
         
         # Basic format validation (adjust based on your App ID format)
-        return app_id.replace('-', '').replace('_', '').isalnum()
+        return APP_ID_PATTERN.fullmatch(app_id) is not None
     
     @staticmethod
+    @lru_cache(maxsize=512)
     def sanitize_input(input_str: str) -> str:
         """Basic input sanitization"""
         if not input_str:
             return ""
         
-        # Remove potentially dangerous characters
-        dangerous_chars = ['<', '>', '"', "'", '&', ';', '(', ')', '|', '`', '$']
-        for char in dangerous_chars:
-            input_str = input_str.replace(char, '')
-        
-        return input_str.strip()
+        # Remove potentially dangerous characters in a single pass
+        return input_str.translate(SANITIZE_DELETE_TABLE).strip()
+
+@lru_cache(maxsize=1024)
+def parse_iso_datetime(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp, accepting a trailing 'Z' for UTC"""
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
 
 class ExportSecurity:
     """Export-specific security measures"""
@@ -123,17 +361,16 @@ class ExportSecurity:
         warnings = []
         
         # Check date range
-        if 'start_date' in request_data and 'end_date' in request_data:
-            start_date = request_data['start_date']
-            end_date = request_data['end_date']
-            
+        start_date = request_data.get('start_date')
+        end_date = request_data.get('end_date')
+        if start_date and end_date:
             if isinstance(start_date, str):
-                start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+                start_date = parse_iso_datetime(start_date)
             if isinstance(end_date, str):
-                end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+                end_date = parse_iso_datetime(end_date)
             
-            date_diff = end_date - start_date
-            if date_diff.days > SecurityConfig.MAX_EXPORT_DAYS:
+            # Same cut-off as timedelta.days > MAX_EXPORT_DAYS, without the floor division
+            if (end_date - start_date).total_seconds() >= (SecurityConfig.MAX_EXPORT_DAYS + 1) * 86400:
                 errors.append(f"Date range cannot exceed {SecurityConfig.MAX_EXPORT_DAYS} days")
         
         # Check app_id
@@ -154,15 +391,33 @@ class ExportSecurity:
             'sanitized_data': request_data
         }
 
+def create_rate_limiter():
+    """Redis-backed limiter when REDIS_URL is configured, otherwise the in-memory one"""
+    if Config.REDIS_URL:
+        import redis  # Only needed when a shared limiter is configured
+        return RedisRateLimiter(redis.Redis.from_url(Config.REDIS_URL))
+    return RateLimiter()
+
 # Global rate limiter instance
-rate_limiter = RateLimiter()
+rate_limiter = create_rate_limiter()
+
+# Global token bucket for smoothed (non-windowed) limits
+token_bucket_limiter = TokenBucketLimiter()
+
+# Global share token pool
+share_token_pool = TokenPool()
+
+def iter_rate_limit_headers(max_requests: int, remaining: int, reset_at: int) -> Iterator[Tuple[bytes, bytes]]:
+    """Lazily yield raw rate limit header pairs (for response.headers.raw); nothing is formatted until consumed"""
+    yield b"x-ratelimit-limit", str(max_requests).encode()
+    yield b"x-ratelimit-remaining", str(remaining).encode()
+    yield b"x-ratelimit-reset", str(reset_at).encode()
+
+def build_rate_limit_headers(max_requests: int, remaining: int, reset_at: int) -> Dict[str, str]:
+    """Rate limit headers as a dict (e.g. for an HTTPException), from a single rate_limiter.check() call"""
+    return {name.decode(): value.decode() for name, value in iter_rate_limit_headers(max_requests, remaining, reset_at)}
 
 def get_rate_limit_headers(key: str, max_requests: int, window_seconds: int) -> Dict[str, str]:
-    """Get rate limit headers for response"""
+    """Get rate limit headers for response (prefer check() + iter_rate_limit_headers when also enforcing)"""
     remaining = rate_limiter.get_remaining_requests(key, max_requests, window_seconds)
-    
-    return {
-        "X-RateLimit-Limit": str(max_requests),
-        "X-RateLimit-Remaining": str(remaining),
-        "X-RateLimit-Reset": str(int(time.time() + window_seconds))
-    }
\ No newline at end of file
+    return build_rate_limit_headers(max_requests, remaining, int(time.time() + window_seconds))
\ No newline at end of file
@@ -1,59 +1,227 @@
 import asyncio
+import csv
+import hashlib
+import io
 import json
 import logging
+import math
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Any, Set
+from typing import Callable, Dict, Any, List, Optional, Set
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from database import SessionLocal, WebhookEvent, ChannelSession, ChannelMetrics, UserMetrics, RoleEvent
+from sqlalchemy import or_, and_, bindparam, case, func, insert, lambda_stmt, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import Config
+from database import SessionLocal, WebhookEvent, ChannelSession, ChannelMetrics, UserMetrics, RoleEvent, AppDimensionSummary
 from models import WebhookRequest
 from mappings import log_unknown_values
 
 logger = logging.getLogger(__name__)
 
+# Dialects with INSERT ... ON CONFLICT DO UPDATE, used to bump metric counters in one statement
+UPSERT_INSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+# Events that move a channel's first/last activity: channel created (101), destroyed (102), user leaves
+ACTIVITY_EVENT_TYPES = frozenset({101, 102, 104, 106, 108})
+
+# Metrics rows written back from in-memory deltas: unique key, and the columns deltas add to
+CHANNEL_METRICS_KEY = ('app_id', 'channel_name', 'channel_session_id', 'date')
+CHANNEL_METRICS_COUNTERS = ('total_users', 'unique_users', 'total_minutes')
+USER_METRICS_KEY = ('app_id', 'uid', 'channel_name', 'date')
+USER_METRICS_COUNTERS = ('session_count', 'total_minutes')
+ACTIVITY_COLUMNS = ('first_activity', 'last_activity')
+
+def keep_activity_bound(column, value, earliest: bool):
+    """SQL keeping a stored first/last activity unless value widens it (a NULL value never does)"""
+    widens = column > value if earliest else column < value
+    return case((value.is_(None), column), (or_(column.is_(None), widens), value), else_=column)
+
+# Open-session lookups run for every join, leave and role event; lambda_stmt caches the compiled SQL
+# and its cache key, so each call only binds values. Both lock the row until commit (FOR UPDATE on PostgreSQL)
+OPEN_SESSION_IN_EPOCH = lambda_stmt(lambda: select(ChannelSession).where(
+    ChannelSession.app_id == bindparam('app_id'),
+    ChannelSession.channel_name == bindparam('channel_name'),
+    ChannelSession.channel_session_id == bindparam('channel_session_id'),
+    ChannelSession.uid == bindparam('uid'),
+    ChannelSession.leave_time.is_(None)
+).limit(1).with_for_update())
+LATEST_OPEN_SESSION = lambda_stmt(lambda: select(ChannelSession).where(
+    ChannelSession.app_id == bindparam('app_id'),
+    ChannelSession.channel_name == bindparam('channel_name'),
+    ChannelSession.uid == bindparam('uid'),
+    ChannelSession.leave_time.is_(None)
+).order_by(ChannelSession.join_time.desc()).limit(1).with_for_update())
+
+# Batches with at least this many deferred webhook events are loaded with COPY on PostgreSQL (psycopg2)
+COPY_MIN_ROWS = 100
+WEBHOOK_EVENT_COLUMNS = (
+    'app_id', 'notice_id', 'product_id', 'event_type', 'channel_name', 'uid', 'client_seq',
+    'platform', 'reason', 'client_type', 'ts', 'duration', 'channel_session_id', 'received_at', 'raw_payload'
+)
+
+# False-positive rate of the notice_id Bloom filter at capacity; a false positive only costs a database lookup
+BLOOM_ERROR_RATE = 1e-4
+# Allowance for an event's ts running ahead of our clock when deciding whether the filter covers it
+NOTICE_ID_TS_SKEW_SECONDS = 300
+
+class SlidingBloomFilter:
+    """Two rotating Bloom filters remembering keys added over the last one to two windows"""
+    
+    def __init__(self, capacity: int, window_seconds: int, error_rate: float = BLOOM_ERROR_RATE):
+        # Bits and hash count per generation for error_rate at capacity keys
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.window_seconds = window_seconds
+        self.current = bytearray((self.size + 7) // 8)
+        self.previous = bytearray(len(self.current))
+        self.current_started = time.time()
+        # Keys added before this moment may be forgotten (process start, then the older generation's start)
+        self.covered_since = self.current_started
+    
+    def _positions(self, key: str) -> List[int]:
+        """Bit positions for a key, derived from one blake2b digest (double hashing)"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hash_count)]
+    
+    def _rotate(self):
+        """Start a fresh generation once the current one is a window old, dropping the oldest"""
+        now = time.time()
+        if now - self.current_started >= self.window_seconds:
+            self.previous = self.current
+            self.current = bytearray(len(self.previous))
+            self.covered_since = self.current_started
+            self.current_started = now
+    
+    def add(self, key: str):
+        self._rotate()
+        for position in self._positions(key):
+            self.current[position >> 3] |= 1 << (position & 7)
+    
+    def might_contain(self, key: str, since: float) -> bool:
+        """False only if key surely wasn't added at or after `since`; always True before the filter's memory starts"""
+        self._rotate()
+        if since < self.covered_since:
+            return True
+        positions = self._positions(key)
+        return (all(self.current[position >> 3] & (1 << (position & 7)) for position in positions)
+                or all(self.previous[position >> 3] & (1 << (position & 7)) for position in positions))
+
 class WebhookProcessor:
     """Processes webhook events and updates database"""
     
     def __init__(self):
-        self.db = SessionLocal()
-        # In-memory cache to track recent noticeIds (max 10 entries)
-        self.recent_notice_ids: Set[str] = set()
+        # Session for the batch being applied; checked out of the pool per batch, None in between
+        self.db: Optional[Session] = None
+        # In-memory LRU of recent noticeIds (max 10 entries), least recently seen first
+        self.recent_notice_ids: OrderedDict[str, None] = OrderedDict()
         self.max_cache_size = 10
+        # Every noticeId seen within the dedup window; only a "maybe seen" answer needs a database lookup
+        self.seen_notice_ids = SlidingBloomFilter(Config.DEDUP_BLOOM_CAPACITY, Config.DEDUP_WINDOW_SECONDS)
         # In-memory cache to track active channel sessions
         self.active_channel_sessions: Dict[str, str] = {}  # {app_id:channel_name -> channel_session_id}
+        # (app_id, platform, client_type) combinations already recorded in app_dimension_summary
+        self.known_dimensions: Set[tuple] = set()
+        # Combinations added in the open transaction, known only once it commits
+        self.pending_dimensions: Set[tuple] = set()
+        # (app_id, channel_name) given a session row in the open transaction, then once committed
+        self.new_session_channels: Set[tuple] = set()
+        self.committed_session_channels: Set[tuple] = set()
+        # Called on the event loop with (app_id, channel_name) after a batch commits a session in that channel
+        self.on_session_channel: Optional[Callable[[str, str], None]] = None
+        # Webhooks waiting for the batch worker: (app_id, webhook_data, raw_payload)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=Config.WEBHOOK_QUEUE_SIZE)
+        # Single thread that owns the session, so batches never run concurrently or hop connections
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook-db")
+        # User event rows held back while a batch is processed, written in one go at commit
+        self.defer_event_rows = False
+        self.pending_event_rows: List[Dict[str, Any]] = []
+        # Every notice_id processed since the batch started, however its row is written
+        self.batch_notice_ids: Set[str] = set()
+        # Metric changes accumulated during a batch, keyed by metrics row, written back before it commits
+        self.channel_deltas: Dict[tuple, Dict[str, Any]] = {}
+        self.user_deltas: Dict[tuple, Dict[str, Any]] = {}
+        # Channel metrics rows whose sessions moved epoch (provisional merges), recounted after write-back
+        self.recount_channel_keys: Set[tuple] = set()
+        # notice_ids of the current batch that are already in webhook_events
+        self.stored_notice_ids: Set[str] = set()
     
     def _is_duplicate_webhook(self, notice_id: str) -> bool:
         """Check if this notice_id has been seen recently (in-memory + database check)"""
         logger.info(f"Checking for duplicate notice_id: {notice_id}")
-        logger.info(f"Current cache: {list(self.recent_notice_ids)}")
         
-        # First check in-memory cache
+        # First check in-memory cache, then everything this batch has already processed
         if notice_id in self.recent_notice_ids:
+            self.recent_notice_ids.move_to_end(notice_id)
+            logger.warning(f"DUPLICATE WEBHOOK DETECTED in cache for notice_id: {notice_id}")
+            return True
+        if notice_id in self.batch_notice_ids:
             logger.warning(f"DUPLICATE WEBHOOK DETECTED in cache for notice_id: {notice_id}")
             return True
         
-        # Also check database for existing notice_id
-        existing_event = self.db.query(WebhookEvent).filter(WebhookEvent.notice_id == notice_id).first()
-        if existing_event:
+        # Also check the notice_ids the batch found already stored in the database
+        if notice_id in self.stored_notice_ids:
             logger.warning(f"DUPLICATE WEBHOOK DETECTED in database for notice_id: {notice_id}")
             return True
         
         logger.info(f"Notice_id {notice_id} is unique")
         return False
     
+    def _load_stored_notice_ids(self, events: List[tuple]):
+        """Look up which of a batch's notice_ids are already stored, in one query for the whole batch"""
+        # The filter is per process: it only proves this worker hasn't seen a notice_id, not that no other
+        # worker stored it. User events may still skip the query on a miss, because their rows are inserted
+        # with a conflict check before the batch commits and a conflict replays the batch per event.
+        # Channel create/destroy move the channel epoch before their row is written, so they always look up
+        notice_ids = [
+            webhook_data.noticeId for _, webhook_data, _ in events
+            if webhook_data.eventType in [101, 102]
+            or self.seen_notice_ids.might_contain(webhook_data.noticeId, webhook_data.payload.ts - NOTICE_ID_TS_SKEW_SECONDS)
+        ]
+        if not notice_ids:
+            self.stored_notice_ids = set()
+            return
+        self.stored_notice_ids = {
+            notice_id for (notice_id,) in self.db.query(WebhookEvent.notice_id).filter(WebhookEvent.notice_id.in_(notice_ids))
+        }
+    
     def _add_to_cache(self, notice_id: str):
         """Add notice_id to cache, maintaining max size"""
-        # If cache is full, remove the oldest entry (FIFO)
-        if len(self.recent_notice_ids) >= self.max_cache_size:
-            # Convert set to list to remove first element
-            notice_ids_list = list(self.recent_notice_ids)
-            self.recent_notice_ids.remove(notice_ids_list[0])
-        
-        # Add new notice_id
-        self.recent_notice_ids.add(notice_id)
+        self.seen_notice_ids.add(notice_id)
+        self.recent_notice_ids[notice_id] = None
+        self.recent_notice_ids.move_to_end(notice_id)
+        # If cache is full, evict the least recently seen entry (LRU)
+        if len(self.recent_notice_ids) > self.max_cache_size:
+            self.recent_notice_ids.popitem(last=False)
         logger.debug(f"Added notice_id {notice_id} to cache. Cache size: {len(self.recent_notice_ids)}")
     
+    def _record_app_dimension(self, app_id: str, platform: int, client_type: int):
+        """Add a (platform, client_type) pair to the app's dimension summary if it is new"""
+        dimension = (app_id, platform, client_type)
+        if dimension in self.known_dimensions or dimension in self.pending_dimensions:
+            return
+        
+        existing = self.db.query(AppDimensionSummary.id).filter(
+            AppDimensionSummary.app_id == app_id,
+            AppDimensionSummary.platform == platform,  # None compares as IS NULL
+            AppDimensionSummary.client_type == client_type
+        ).first()
+        if not existing:
+            self.db.add(AppDimensionSummary(app_id=app_id, platform=platform, client_type=client_type))
+        self.pending_dimensions.add(dimension)
+    
+    def _settle_transaction(self, committed: bool):
+        """Keep what the open transaction recorded in memory if it committed, forget it if it rolled back"""
+        if committed:
+            self.known_dimensions |= self.pending_dimensions
+            self.committed_session_channels |= self.new_session_channels
+        self.pending_dimensions.clear()
+        self.new_session_channels.clear()
+    
     def _get_or_create_channel_session_id(self, app_id: str, channel_name: str) -> str:
         """Get or create a channel session ID for the given app_id and channel_name"""
         session_key = f"{app_id}:{channel_name}"
@@ -104,7 +272,7 @@ class WebhookProcessor:
             
             # If no active epoch, find the latest open epoch for this channel
             # This handles out-of-order events where user events come before channel create
-            recent_create = self.db.query(WebhookEvent).filter(
+            recent_create = self.db.query(WebhookEvent.ts).filter(
                 WebhookEvent.app_id == app_id,
                 WebhookEvent.channel_name == channel_name,
                 WebhookEvent.event_type == 101,  # Channel created
@@ -113,13 +281,11 @@ class WebhookProcessor:
             
             if recent_create:
                 # Check if this create event hasn't been destroyed yet
-                destroy_event = self.db.query(WebhookEvent).filter(
-                    WebhookEvent.app_id == app_id,
-                    WebhookEvent.channel_name == channel_name,
-                    WebhookEvent.event_type == 102,  # Channel destroyed
+                destroy_event = self._channel_event_exists(
+                    app_id, channel_name, 102,  # Channel destroyed
                     WebhookEvent.ts > recent_create.ts,  # Destroy after create
                     WebhookEvent.ts <= ts  # Destroy before or at this user event
-                ).first()
+                )
                 
                 if not destroy_event:
                     # Channel is still active, use this epoch
@@ -132,7 +298,7 @@ class WebhookProcessor:
             # where the leave event timestamp falls between create and destroy timestamps
             if event_type in [104, 106, 108]:  # Leave events
                 # Find channel create event where create_ts <= leave_ts
-                create_event = self.db.query(WebhookEvent).filter(
+                create_event = self.db.query(WebhookEvent.ts).filter(
                     WebhookEvent.app_id == app_id,
                     WebhookEvent.channel_name == channel_name,
                     WebhookEvent.event_type == 101,  # Channel created
@@ -141,13 +307,11 @@ class WebhookProcessor:
                 
                 if create_event:
                     # Find channel destroy event where create_ts < destroy_ts <= leave_ts
-                    destroy_event = self.db.query(WebhookEvent).filter(
-                        WebhookEvent.app_id == app_id,
-                        WebhookEvent.channel_name == channel_name,
-                        WebhookEvent.event_type == 102,  # Channel destroyed
+                    destroy_event = self._channel_event_exists(
+                        app_id, channel_name, 102,  # Channel destroyed
                         WebhookEvent.ts > create_event.ts,  # Destroy after create
                         WebhookEvent.ts <= ts  # Destroy before or at leave event
-                    ).first()
+                    )
                     
                     if destroy_event:
                         # Use the channel session ID from the create event
@@ -159,7 +323,7 @@ class WebhookProcessor:
             
             # Also check if there's a channel destroy event at the same timestamp
             # This handles cases where user events happen at the same time as channel destroy
-            destroy_at_same_time = self.db.query(WebhookEvent).filter(
+            destroy_at_same_time = self.db.query(WebhookEvent.raw_payload).filter(
                 WebhookEvent.app_id == app_id,
                 WebhookEvent.channel_name == channel_name,
                 WebhookEvent.event_type == 102,  # Channel destroyed
@@ -168,7 +332,7 @@ class WebhookProcessor:
             
             if destroy_at_same_time:
                 # Find the channel create event that was destroyed at this timestamp
-                create_before_destroy = self.db.query(WebhookEvent).filter(
+                create_before_destroy = self.db.query(WebhookEvent.ts).filter(
                     WebhookEvent.app_id == app_id,
                     WebhookEvent.channel_name == channel_name,
                     WebhookEvent.event_type == 101,  # Channel created
@@ -185,11 +349,12 @@ class WebhookProcessor:
                 # Backup: Check if the user's sid matches the channel destroy sid
                 # This handles cases where the timestamp approach doesn't work
                 try:
-                    destroy_sid = json.loads(destroy_at_same_time.raw_payload).get('sid')
-                    user_sid = json.loads(webhook_data.raw_payload).get('sid')
+                    # The incoming event is already parsed; only the stored destroy payload needs decoding
+                    user_sid = webhook_data.sid
+                    destroy_sid = user_sid and json.loads(destroy_at_same_time.raw_payload).get('sid')
                     if destroy_sid and user_sid and destroy_sid == user_sid:
                         # Find the channel create event that was destroyed at this timestamp
-                        create_before_destroy = self.db.query(WebhookEvent).filter(
+                        create_before_destroy = self.db.query(WebhookEvent.ts).filter(
                             WebhookEvent.app_id == app_id,
                             WebhookEvent.channel_name == channel_name,
                             WebhookEvent.event_type == 101,  # Channel created
@@ -209,7 +374,7 @@ class WebhookProcessor:
             # This prevents creating multiple provisional sessions for the same channel
             # when events arrive after a channel destroy event removed the session from cache
             # We check for the most recent provisional session that exists before or at this event timestamp
-            existing_provisional = self.db.query(WebhookEvent).filter(
+            existing_provisional = self.db.query(WebhookEvent.channel_session_id).filter(
                 WebhookEvent.app_id == app_id,
                 WebhookEvent.channel_name == channel_name,
                 WebhookEvent.channel_session_id.like('%_provisional'),
@@ -229,13 +394,11 @@ class WebhookProcessor:
                 
                 # Check if a channel destroy event happened after the provisional session but before this event
                 if provisional_ts is not None:
-                    destroy_after_provisional = self.db.query(WebhookEvent).filter(
-                        WebhookEvent.app_id == app_id,
-                        WebhookEvent.channel_name == channel_name,
-                        WebhookEvent.event_type == 102,  # Channel destroyed
+                    destroy_after_provisional = self._channel_event_exists(
+                        app_id, channel_name, 102,  # Channel destroyed
                         WebhookEvent.ts > provisional_ts,  # Destroy after provisional session
                         WebhookEvent.ts < ts  # Destroy before current event (not at same timestamp)
-                    ).first()
+                    )
                     
                     if destroy_after_provisional:
                         # A destroy event happened between the provisional session and this event
@@ -252,7 +415,7 @@ class WebhookProcessor:
             
             # Also check ChannelSession table for provisional sessions
             # Use the earliest join time to get the original provisional session
-            existing_session = self.db.query(ChannelSession).filter(
+            existing_session = self.db.query(ChannelSession.channel_session_id).filter(
                 ChannelSession.app_id == app_id,
                 ChannelSession.channel_name == channel_name,
                 ChannelSession.channel_session_id.like('%_provisional')
@@ -270,13 +433,11 @@ class WebhookProcessor:
                 
                 # Check if a channel destroy event happened after the provisional session but before this event
                 if provisional_ts is not None:
-                    destroy_after_provisional = self.db.query(WebhookEvent).filter(
-                        WebhookEvent.app_id == app_id,
-                        WebhookEvent.channel_name == channel_name,
-                        WebhookEvent.event_type == 102,  # Channel destroyed
+                    destroy_after_provisional = self._channel_event_exists(
+                        app_id, channel_name, 102,  # Channel destroyed
                         WebhookEvent.ts > provisional_ts,  # Destroy after provisional session
                         WebhookEvent.ts < ts  # Destroy before current event (not at same timestamp)
-                    ).first()
+                    )
                     
                     if destroy_after_provisional:
                         # A destroy event happened between the provisional session and this event
@@ -300,6 +461,15 @@ class WebhookProcessor:
         
         return None
 
+    def _channel_event_exists(self, app_id: str, channel_name: str, event_type: int, *criteria) -> bool:
+        """Whether a stored event of this type matches the criteria, checked with EXISTS instead of loading the row"""
+        return self.db.query(self.db.query(WebhookEvent.id).filter(
+            WebhookEvent.app_id == app_id,
+            WebhookEvent.channel_name == channel_name,
+            WebhookEvent.event_type == event_type,
+            *criteria
+        ).exists()).scalar()
+
     def _close_channel_session(self, app_id: str, channel_name: str):
         """Close a channel session when channel is destroyed (event 102)"""
         session_key = f"{app_id}:{channel_name}"
@@ -312,6 +482,8 @@ class WebhookProcessor:
     
     def _merge_provisional_sessions(self, app_id: str, channel_name: str, correct_session_id: str):
         """Merge provisional sessions into the correct channel session when channel is created"""
+        savepoint = None
+        merged_epochs = []  # (session, provisional channel_session_id it was counted under)
         try:
             # Extract timestamp from correct_session_id to find provisional sessions for this specific epoch
             session_parts = correct_session_id.split('_')
@@ -328,9 +500,12 @@ class WebhookProcessor:
                 logger.warning(f"Cannot extract timestamp from session ID: {correct_session_id}")
                 return
             
+            # The merge joins the batch's transaction; a failure rolls back only the merge, not earlier events
+            savepoint = self.db.begin_nested()
+            
             # Find provisional sessions that belong to this specific epoch
             # They should be between this create event and the next create event (or now if no next create)
-            next_create = self.db.query(WebhookEvent).filter(
+            next_create = self.db.query(WebhookEvent.ts).filter(
                 WebhookEvent.app_id == app_id,
                 WebhookEvent.channel_name == channel_name,
                 WebhookEvent.event_type == 101,  # Channel created
@@ -361,7 +536,7 @@ class WebhookProcessor:
             if next_create:
                 # Look for provisional sessions that happened after the previous channel destroy
                 # but before this new channel create
-                previous_destroy = self.db.query(WebhookEvent).filter(
+                previous_destroy = self.db.query(WebhookEvent.ts).filter(
                     WebhookEvent.app_id == app_id,
                     WebhookEvent.channel_name == channel_name,
                     WebhookEvent.event_type == 102,  # Channel destroyed
@@ -389,42 +564,42 @@ class WebhookProcessor:
                 for session in provisional_sessions:
                     old_session_id = session.channel_session_id
                     session.channel_session_id = correct_session_id
-                    session.updated_at = datetime.utcnow()
+                    merged_epochs.append((session, old_session_id))
                     logger.info(f"Merged provisional session {session.id} (UID {session.uid}) from {old_session_id} to {correct_session_id}")
                 
-                self.db.commit()
+                self.db.flush()
                 logger.info(f"Successfully merged {len(provisional_sessions)} provisional sessions")
                 
                 # Also update RoleEvent records that have provisional session IDs
-                # Find role events with provisional session IDs that match this channel/epoch
-                provisional_role_events = self.db.query(RoleEvent).filter(
+                # Role events belong to the merged epoch when create_event_ts <= ts < end_ts; one UPDATE, no rows loaded
+                updated_role_events = self.db.query(RoleEvent).filter(
                     RoleEvent.app_id == app_id,
                     RoleEvent.channel_name == channel_name,
-                    RoleEvent.channel_session_id.like('%_provisional')
-                ).all()
-                
-                # Update role events that belong to this epoch
-                updated_role_events = 0
-                for role_event in provisional_role_events:
-                    # Check if this role event belongs to the merged epoch
-                    # Role events should have timestamp >= create_event_ts and < end_ts
-                    if create_event_ts <= role_event.ts < end_ts:
-                        old_role_session_id = role_event.channel_session_id
-                        role_event.channel_session_id = correct_session_id
-                        updated_role_events += 1
-                        logger.info(f"Merged role event {role_event.id} (UID {role_event.uid}) from {old_role_session_id} to {correct_session_id}")
+                    RoleEvent.channel_session_id.like('%_provisional'),
+                    RoleEvent.ts >= create_event_ts,
+                    RoleEvent.ts < end_ts
+                ).update({RoleEvent.channel_session_id: correct_session_id}, synchronize_session=False)
                 
                 if updated_role_events > 0:
-                    self.db.commit()
                     logger.info(f"Successfully merged {updated_role_events} provisional role events")
             else:
                 logger.debug(f"No provisional sessions found for epoch {create_event_ts} in channel {channel_name}")
+            
+            savepoint.commit()
+            # Merged sessions were already counted under their provisional epoch when created, so both epochs'
+            # channel rows are recounted from channel_sessions at write-back (user rows don't key on the epoch)
+            for session, old_session_id in merged_epochs:
+                date = self._metrics_date(session.join_time)
+                for epoch in (old_session_id, correct_session_id):
+                    self._channel_delta(app_id, channel_name, epoch, date)
+                    self.recount_channel_keys.add((app_id, channel_name, epoch, date))
                 
         except Exception as e:
             logger.error(f"Error merging provisional sessions for {app_id}/{channel_name}: {e}")
-            self.db.rollback()
+            if savepoint is not None and savepoint.is_active:
+                savepoint.rollback()
 
-    async def _process_event_by_type(self, app_id: str, webhook_data: WebhookRequest, channel_session_id: str = None):
+    def _process_event_by_type(self, app_id: str, webhook_data: WebhookRequest, event_time: datetime, channel_session_id: str = None):
         """Process webhook event based on its type"""
         event_type = webhook_data.eventType
         uid = webhook_data.payload.uid
@@ -450,11 +625,11 @@ class WebhookProcessor:
         # Handle user events that require uid and clientSeq
         if uid is not None and client_seq is not None:
             if event_type in [103, 105, 107]:  # User joined channel
-                await self._handle_user_join(app_id, webhook_data, channel_session_id)
+                self._handle_user_join(app_id, webhook_data, event_time, channel_session_id)
             elif event_type in [104, 106, 108]:  # User left channel
-                await self._handle_user_leave(app_id, webhook_data, channel_session_id)
+                self._handle_user_leave(app_id, webhook_data, event_time, channel_session_id)
             elif event_type in [111, 112]:  # Role changes
-                await self._handle_role_change(app_id, webhook_data, channel_session_id)
+                self._handle_role_change(app_id, webhook_data, event_time, channel_session_id)
         else:
             # Log which specific field is missing for better debugging
             missing_fields = []
@@ -470,87 +645,279 @@ class WebhookProcessor:
             "cache_size": len(self.recent_notice_ids),
             "max_cache_size": self.max_cache_size,
             "recent_notice_ids": list(self.recent_notice_ids),
+            "dedup_window_seconds": self.seen_notice_ids.window_seconds,
             "active_channel_sessions": self.active_channel_sessions
         }
 
     async def process_webhook(self, app_id: str, webhook_data: WebhookRequest, raw_payload: str):
-        """Process a webhook event and update relevant tables for the specific App ID"""
+        """Queue a webhook event for the batch worker, which applies it in arrival order"""
+        await self.queue.put((app_id, webhook_data, raw_payload))
+    
+    async def run_batch_worker(self):
+        """Drain queued webhooks and apply each batch in a single transaction (runs for the app's lifetime)"""
+        while True:
+            events = await self._drain_queue()
+            try:
+                for attempt in range(1, Config.WEBHOOK_BATCH_RETRIES + 1):
+                    try:
+                        # Database work is blocking, so it runs on the processor's own thread and the loop keeps serving requests
+                        channels = await asyncio.get_running_loop().run_in_executor(self.db_executor, self._process_batch, events)
+                    except Exception as e:
+                        # Webhooks were already acknowledged, so retry (events committed by a partial replay are
+                        # skipped as duplicates) and keep the batch in the dead-letter file if it still fails
+                        logger.error(f"Error applying batch of {len(events)} webhook events (attempt {attempt}): {e}")
+                        if attempt == Config.WEBHOOK_BATCH_RETRIES:
+                            self._dead_letter(events, e)
+                        else:
+                            await asyncio.sleep(attempt)
+                        continue
+                    if self.on_session_channel is not None:
+                        for app_id, channel_name in channels:
+                            self.on_session_channel(app_id, channel_name)
+                    break
+            finally:
+                for _ in events:
+                    self.queue.task_done()
+    
+    async def _drain_queue(self) -> List[tuple]:
+        """Wait for one queued event, then collect more until the batch is full or the flush window ends"""
+        events = [await self.queue.get()]
+        deadline = time.monotonic() + Config.WEBHOOK_FLUSH_MS / 1000
+        while len(events) < Config.WEBHOOK_BATCH_SIZE:
+            try:
+                events.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                events.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return events
+    
+    def _process_batch(self, events: List[tuple]) -> Set[tuple]:
+        """Apply a batch of webhook events on a session borrowed from the pool for just this batch;
+        returns the (app_id, channel_name) pairs it committed new sessions in"""
+        self.db = SessionLocal()
         try:
-            logger.info(f"Processing webhook for App ID: {app_id}, Event Type: {webhook_data.eventType}, Notice ID: {webhook_data.noticeId}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}")
-            
-            # Check for duplicates using in-memory cache
-            if self._is_duplicate_webhook(webhook_data.noticeId):
-                logger.info(f"Skipping duplicate webhook for notice_id: {webhook_data.noticeId}")
-                return  # Exit early for duplicates
-            
-            # Add to cache to prevent future duplicates
-            self._add_to_cache(webhook_data.noticeId)
-            
-            # Handle channel session lifecycle
-            channel_session_id = self._get_channel_session_id_for_event(app_id, webhook_data)
-            
-            # Store raw webhook event (automatically creates tables if they don't exist)
-            await self._store_webhook_event(app_id, webhook_data, raw_payload, channel_session_id)
-            
-            # Log unknown values for future mapping
-            log_unknown_values(
-                webhook_data.payload.platform,
-                webhook_data.productId,
-                webhook_data.eventType,
-                webhook_data.payload.channelName
-            )
-            
-            # Process based on event type
-            await self._process_event_by_type(app_id, webhook_data, channel_session_id)
-            
-            # Update metrics
-            await self._update_metrics(app_id, webhook_data, channel_session_id)
-            
+            self._apply_batch(events)
+        finally:
+            self.db.close()
+            self.db = None
+        channels, self.committed_session_channels = self.committed_session_channels, set()
+        return channels
+    
+    def _apply_batch(self, events: List[tuple]):
+        """Apply a batch of webhook events and commit once; replay one by one if any event fails"""
+        self.defer_event_rows = True
+        self.batch_notice_ids.clear()
+        try:
+            self._load_stored_notice_ids(events)
+            for app_id, webhook_data, raw_payload in events:
+                self._process_event(app_id, webhook_data, raw_payload)
+            self._write_pending_events()
+            self._write_metric_deltas()
             self.db.commit()
-            logger.info(f"Successfully processed webhook for App ID: {app_id}, Event Type: {webhook_data.eventType}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}")
-            
+            self._settle_transaction(committed=True)
+            logger.info(f"Committed batch of {len(events)} webhook events")
+            return
         except Exception as e:
             self.db.rollback()
-            logger.error(f"Error processing webhook for App ID {app_id}: {e}")
-            raise
+            self._settle_transaction(committed=False)
+            self._clear_pending_events()
+            self._clear_metric_deltas()
+            self.batch_notice_ids.clear()
+            logger.error(f"Error processing batch of {len(events)} webhook events, retrying individually: {e}")
+        finally:
+            self.defer_event_rows = False
+        
+        # Forget notice_ids cached by the rolled-back attempt so the replay isn't skipped as duplicates
+        for _, webhook_data, _ in events:
+            self.recent_notice_ids.pop(webhook_data.noticeId, None)
+        
+        for event in events:
+            app_id, webhook_data, raw_payload = event
+            try:
+                self._load_stored_notice_ids([event])
+                self._process_event(app_id, webhook_data, raw_payload)
+                self._write_metric_deltas()
+                self.db.commit()
+                self._settle_transaction(committed=True)
+            except Exception as e:
+                self.db.rollback()
+                self._settle_transaction(committed=False)
+                self._clear_metric_deltas()
+                self.batch_notice_ids.discard(webhook_data.noticeId)
+                logger.error(f"Error processing webhook for App ID {app_id}, Notice ID: {webhook_data.noticeId}: {e}")
+                self._dead_letter([event], e)
     
-    async def _store_webhook_event(self, app_id: str, webhook_data: WebhookRequest, raw_payload: str, channel_session_id: str = None):
-        """Store raw webhook event in database"""
-        # Note: Duplicate checking is now handled by in-memory cache in process_webhook()
+    def _dead_letter(self, events: List[tuple], error: Exception):
+        """Append webhook events that could not be applied to the dead-letter file, for inspection and re-sending"""
+        failed_at = datetime.utcnow().isoformat()
+        try:
+            with open(Config.WEBHOOK_DEAD_LETTER_FILE, 'a', encoding='utf-8') as dead_letters:
+                for app_id, webhook_data, raw_payload in events:
+                    dead_letters.write(json.dumps({
+                        'app_id': app_id,
+                        'notice_id': webhook_data.noticeId,
+                        'error': str(error),
+                        'failed_at': failed_at,
+                        'raw_payload': raw_payload
+                    }) + '\n')
+        except OSError as e:
+            logger.error(f"Could not write {len(events)} failed webhook events to {Config.WEBHOOK_DEAD_LETTER_FILE}: {e}")
+    
+    def _process_event(self, app_id: str, webhook_data: WebhookRequest, raw_payload: str):
+        """Process a webhook event and update relevant tables for the specific App ID (caller commits)"""
+        logger.info(f"Processing webhook for App ID: {app_id}, Event Type: {webhook_data.eventType}, Notice ID: {webhook_data.noticeId}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}")
         
-        event = WebhookEvent(
-            app_id=app_id,
-            notice_id=webhook_data.noticeId,
-            product_id=webhook_data.productId,
-            event_type=webhook_data.eventType,
-            channel_name=webhook_data.payload.channelName,
-            uid=webhook_data.payload.uid or 0,  # Default to 0 if uid is None
-            client_seq=webhook_data.payload.clientSeq or 0,  # Default to 0 if clientSeq is None
-            platform=webhook_data.payload.platform,
-            reason=webhook_data.payload.reason,
-            client_type=webhook_data.payload.clientType,
-            ts=webhook_data.payload.ts,
-            duration=webhook_data.payload.duration,
-            channel_session_id=channel_session_id,
-            raw_payload=raw_payload
+        # Check for duplicates using in-memory cache
+        if self._is_duplicate_webhook(webhook_data.noticeId):
+            logger.info(f"Skipping duplicate webhook for notice_id: {webhook_data.noticeId}")
+            return  # Exit early for duplicates
+        
+        # Add to cache to prevent future duplicates
+        self._add_to_cache(webhook_data.noticeId)
+        self.batch_notice_ids.add(webhook_data.noticeId)
+        
+        # Handle channel session lifecycle
+        channel_session_id = self._get_channel_session_id_for_event(app_id, webhook_data)
+        
+        # Local event time, converted once for the session handlers and metrics
+        event_time = datetime.fromtimestamp(webhook_data.payload.ts)
+        
+        # Store raw webhook event (automatically creates tables if they don't exist)
+        if not self._store_webhook_event(app_id, webhook_data, raw_payload, channel_session_id):
+            return  # Another writer stored this notice_id first
+        
+        # Log unknown values for future mapping
+        log_unknown_values(
+            webhook_data.payload.platform,
+            webhook_data.productId,
+            webhook_data.eventType,
+            webhook_data.payload.channelName
         )
-        self.db.add(event)
+        
+        # Process based on event type
+        self._process_event_by_type(app_id, webhook_data, event_time, channel_session_id)
+        
+        # Update metrics
+        self._update_metrics(app_id, webhook_data, event_time, channel_session_id)
+        
+        # Later events in the same batch look up this one's rows, so send them before the batch commits
+        self.db.flush()
+        logger.info(f"Successfully processed webhook for App ID: {app_id}, Event Type: {webhook_data.eventType}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}")
+    
+    def _store_webhook_event(self, app_id: str, webhook_data: WebhookRequest, raw_payload: str, channel_session_id: str = None) -> bool:
+        """Store raw webhook event in database; False if its notice_id was already stored"""
+        # Note: Duplicate checking is now handled by in-memory cache in process_webhook()
+        
+        row = {
+            'app_id': app_id,
+            'notice_id': webhook_data.noticeId,
+            'product_id': webhook_data.productId,
+            'event_type': webhook_data.eventType,
+            'channel_name': webhook_data.payload.channelName,
+            'uid': webhook_data.payload.uid or 0,  # Default to 0 if uid is None
+            'client_seq': webhook_data.payload.clientSeq or 0,  # Default to 0 if clientSeq is None
+            'platform': webhook_data.payload.platform,
+            'reason': webhook_data.payload.reason,
+            'client_type': webhook_data.payload.clientType,
+            'ts': webhook_data.payload.ts,
+            'duration': webhook_data.payload.duration,
+            'channel_session_id': channel_session_id,
+            'received_at': datetime.utcnow(),
+            'raw_payload': raw_payload
+        }
+        
+        # Channel create/destroy rows are looked up by later events in the same batch, so they go in now;
+        # user events are append-only and are written together when the batch commits
+        if self.defer_event_rows and webhook_data.eventType not in [101, 102]:
+            self.pending_event_rows.append(row)
+            return True
+        
+        if not self._insert_webhook_events([row]):
+            logger.warning(f"DUPLICATE WEBHOOK DETECTED on insert for notice_id: {webhook_data.noticeId}")
+            return False
+        return True
+    
+    def _insert_webhook_events(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert webhook event rows in one statement, skipping notice_ids already stored; returns rows inserted"""
+        table = WebhookEvent.__table__
+        insert_statement = UPSERT_INSERTS.get(self.db.get_bind().dialect.name)
+        if insert_statement is None:
+            # Without ON CONFLICT a stored notice_id raises, so every row that returns was inserted
+            self.db.execute(insert(table), rows)
+            return len(rows)
+        
+        # The unique notice_id index settles races with a concurrent writer without failing the batch;
+        # executemany rowcounts aren't reliable across drivers, so count the RETURNING rows instead
+        statement = insert_statement(table).on_conflict_do_nothing(index_elements=['notice_id']).returning(table.c.notice_id)
+        return len(self.db.execute(statement, rows).all())
     
-    async def _handle_user_join(self, app_id: str, webhook_data: WebhookRequest, channel_session_id: str = None):
+    def _write_pending_events(self):
+        """Insert the batch's deferred webhook event rows: COPY on PostgreSQL for large batches, executemany otherwise"""
+        rows = self.pending_event_rows
+        if not rows:
+            return
+        
+        dialect = self.db.get_bind().dialect
+        # copy_expert is psycopg2's API; other drivers take the executemany path
+        if len(rows) >= COPY_MIN_ROWS and dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+            columns = ', '.join(WEBHOOK_EVENT_COLUMNS)
+            # COPY can't skip conflicts, so rows land in a staging table first and move over with
+            # ON CONFLICT DO NOTHING, like the executemany path
+            self.db.execute(text(
+                f"CREATE TEMP TABLE webhook_events_copy ON COMMIT DROP AS SELECT {columns} FROM webhook_events WITH NO DATA"
+            ))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, delimiter='\t', lineterminator='\n')
+            for row in rows:
+                writer.writerow(['\\N' if row[column] is None else row[column] for column in WEBHOOK_EVENT_COLUMNS])
+            buffer.seek(0)
+            
+            # COPY runs on the session's own connection, so it commits with the rest of the batch
+            cursor = self.db.connection().connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f"COPY webhook_events_copy ({columns}) FROM STDIN WITH (FORMAT csv, DELIMITER E'\\t', NULL '\\N')",
+                    buffer
+                )
+            finally:
+                cursor.close()
+            inserted = self.db.execute(text(
+                f"INSERT INTO webhook_events ({columns}) SELECT {columns} FROM webhook_events_copy "
+                "ON CONFLICT (notice_id) DO NOTHING"
+            )).rowcount
+        else:
+            inserted = self._insert_webhook_events(rows)
+        
+        # These rows' session and metric changes are already applied, so a notice_id another writer
+        # stored since the batch's lookup must not commit with them; failing here replays the batch
+        # per event, where each row is inserted before its side effects and skipped on conflict
+        if inserted < len(rows):
+            raise RuntimeError(f"{len(rows) - inserted} of {len(rows)} deferred webhook events were already stored")
+        
+        self._clear_pending_events()
+    
+    def _clear_pending_events(self):
+        """Forget deferred webhook event rows (after they are written or rolled back)"""
+        self.pending_event_rows = []
+    
+    def _handle_user_join(self, app_id: str, webhook_data: WebhookRequest, event_time: datetime, channel_session_id: str = None):
         """Handle user join event using clientSeq for proper ordering"""
-        join_time = datetime.fromtimestamp(webhook_data.payload.ts)
+        join_time = event_time
         uid = webhook_data.payload.uid
         channel_name = webhook_data.payload.channelName
         client_seq = webhook_data.payload.clientSeq
         
-        # Check if there's an existing open session for this user in this channel epoch
-        existing_session = self.db.query(ChannelSession).filter(
-            ChannelSession.app_id == app_id,
-            ChannelSession.channel_name == channel_name,
-            ChannelSession.channel_session_id == channel_session_id,
-            ChannelSession.uid == uid,
-            ChannelSession.leave_time.is_(None)
-        ).first()
+        # Check if there's an existing open session for this user in this channel epoch (locked until commit)
+        existing_session = self.db.execute(OPEN_SESSION_IN_EPOCH, {
+            'app_id': app_id, 'channel_name': channel_name, 'channel_session_id': channel_session_id, 'uid': uid
+        }).scalars().first()
         
         if existing_session:
             # Check if this is an out-of-order event using clientSeq
@@ -565,14 +932,12 @@ class WebhookProcessor:
                 existing_session.join_time = join_time
                 if webhook_data.payload.account:
                     existing_session.account = webhook_data.payload.account
-                existing_session.updated_at = datetime.utcnow()
                 logger.info(f"Updated existing session with earlier join time for user {uid}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}")
             else:
                 # Update existing session join time (reconnection)
                 existing_session.join_time = join_time
                 if webhook_data.payload.account:
                     existing_session.account = webhook_data.payload.account
-                existing_session.updated_at = datetime.utcnow()
                 logger.info(f"Updated existing session join time for user {uid}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}")
         else:
             # Determine initial role based on event type
@@ -600,7 +965,7 @@ class WebhookProcessor:
                 communication_mode=communication_mode,
                 role_switches=0
             )
-            self.db.add(session)
+            self._record_app_dimension(app_id, session.platform, session.client_type)
             logger.info(f"Created new session for user {uid} in channel {channel_name} (epoch: {channel_session_id}), Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}, Role: {'Host' if is_host else 'Audience'}")
             
             # Check for role change events that happened at or after the join timestamp
@@ -612,7 +977,7 @@ class WebhookProcessor:
             
             # Find the actual channel create event timestamp for this session
             # This is more reliable than extracting from channel_session_id
-            actual_channel_create = self.db.query(WebhookEvent).filter(
+            actual_channel_create = self.db.query(WebhookEvent.ts).filter(
                 WebhookEvent.app_id == app_id,
                 WebhookEvent.channel_name == channel_name,
                 WebhookEvent.event_type == 101,  # Channel created
@@ -650,23 +1015,32 @@ class WebhookProcessor:
                     logger.info(f"Applied role change event {role_event.new_role} to session for user {uid}: is_host={is_host_from_role}, role_switches={session.role_switches}")
                 
                 logger.info(f"Applied {len(pending_role_events)} pending role change(s) to new session for user {uid}: final is_host={session.is_host}, total role_switches={session.role_switches}")
+            
+            # Written once its role is settled
+            self._insert_session(session)
+            self._apply_join_delta(app_id, session)
         if existing_session:
             existing_session.last_client_seq = client_seq
-            existing_session.updated_at = datetime.utcnow()
     
-    async def _handle_user_leave(self, app_id: str, webhook_data: WebhookRequest, channel_session_id: str = None):
+    def _insert_session(self, session: ChannelSession):
+        """Insert a new session with a single INSERT ... RETURNING instead of the ORM unit of work, and set its id"""
+        # The object stays outside the ORM session; it only carries the row's values for the metric deltas
+        values = {column.key: getattr(session, column.key) for column in ChannelSession.__table__.columns}
+        values = {key: value for key, value in values.items() if value is not None}
+        session.id = self.db.execute(insert(ChannelSession).values(**values).returning(ChannelSession.id)).scalar_one()
+        self.new_session_channels.add((session.app_id, session.channel_name))
+    
+    def _handle_user_leave(self, app_id: str, webhook_data: WebhookRequest, event_time: datetime, channel_session_id: str = None):
         """Handle user leave event - close existing session with out-of-order handling"""
-        leave_time = datetime.fromtimestamp(webhook_data.payload.ts)
+        leave_time = event_time
         uid = webhook_data.payload.uid
         channel_name = webhook_data.payload.channelName
         
-        # Find the most recent open session for this user in this channel
-        session = self.db.query(ChannelSession).filter(
-            ChannelSession.app_id == app_id,
-            ChannelSession.channel_name == channel_name,
-            ChannelSession.uid == uid,
-            ChannelSession.leave_time.is_(None)
-        ).order_by(ChannelSession.join_time.desc()).first()
+        # Find the most recent open session for this user in this channel, locked until commit
+        # (FOR UPDATE on PostgreSQL; another writer closing it waits instead of losing its update)
+        session = self.db.execute(LATEST_OPEN_SESSION, {
+            'app_id': app_id, 'channel_name': channel_name, 'uid': uid
+        }).scalars().first()
         
         if session:
             # Update sid if provided and not already set
@@ -687,7 +1061,7 @@ class WebhookProcessor:
             # Update account if provided
             if webhook_data.payload.account:
                 session.account = webhook_data.payload.account
-            session.updated_at = datetime.utcnow()
+            self._apply_leave_delta(app_id, session)
             logger.info(f"Closed session for user {uid} with duration {session.duration_seconds} seconds, reason: {session.reason}, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}")
         else:
             # Create a session with duration from webhook payload if available
@@ -720,17 +1094,19 @@ class WebhookProcessor:
                     communication_mode=communication_mode,
                     role_switches=0
                 )
-                self.db.add(session)
+                self._insert_session(session)
+                self._record_app_dimension(app_id, session.platform, session.client_type)
+                self._apply_join_delta(app_id, session)
                 logger.info(f"Created session from leave event for user {uid} with duration {webhook_data.payload.duration} seconds, Product ID: {webhook_data.productId}, Platform: {webhook_data.payload.platform}, Reason: {webhook_data.payload.reason}, Role: {'Host' if is_host else 'Audience'}, Mode: {'RTC' if communication_mode == 1 else 'ILS'}")
             else:
                 logger.warning(f"No open session found for user {uid} leave event and no duration provided")
 
-    async def _handle_role_change(self, app_id: str, webhook_data: WebhookRequest, channel_session_id: str = None):
+    def _handle_role_change(self, app_id: str, webhook_data: WebhookRequest, event_time: datetime, channel_session_id: str = None):
         """Handle role change events (111, 112) - track role switches and communication mode"""
         uid = webhook_data.payload.uid
         channel_name = webhook_data.payload.channelName
         event_type = webhook_data.eventType
-        ts = datetime.fromtimestamp(webhook_data.payload.ts)
+        ts = event_time
         ts_int = webhook_data.payload.ts
         
         # 111: client role change to broadcaster
@@ -756,23 +1132,16 @@ class WebhookProcessor:
         
         # Find the active session for this user and update role information
         # Try to find session by channel_session_id first, then fall back to any open session
-        active_session = self.db.query(ChannelSession).filter(
-            ChannelSession.app_id == app_id,
-            ChannelSession.channel_name == channel_name,
-            ChannelSession.channel_session_id == channel_session_id,
-            ChannelSession.uid == uid,
-            ChannelSession.leave_time.is_(None)
-        ).first()
+        active_session = self.db.execute(OPEN_SESSION_IN_EPOCH, {
+            'app_id': app_id, 'channel_name': channel_name, 'channel_session_id': channel_session_id, 'uid': uid
+        }).scalars().first()
         
         # If no session found with exact channel_session_id, try to find any open session for this user
         # This handles cases where role change happens before join event
         if not active_session:
-            active_session = self.db.query(ChannelSession).filter(
-                ChannelSession.app_id == app_id,
-                ChannelSession.channel_name == channel_name,
-                ChannelSession.uid == uid,
-                ChannelSession.leave_time.is_(None)
-            ).order_by(ChannelSession.join_time.desc()).first()
+            active_session = self.db.execute(LATEST_OPEN_SESSION, {
+                'app_id': app_id, 'channel_name': channel_name, 'uid': uid
+            }).scalars().first()
             
             if active_session:
                 logger.info(f"Found session for role change event (matching by channel/uid only): {active_session.channel_session_id}")
@@ -783,23 +1152,21 @@ class WebhookProcessor:
             # Role switches preserve the existing communication_mode (don't change it)
             # active_session.communication_mode remains unchanged
             active_session.role_switches += 1
-            active_session.updated_at = datetime.utcnow()
             logger.info(f"Updated role for user {uid}: is_host={is_host}, communication_mode={active_session.communication_mode} (preserved), role_switches={active_session.role_switches}")
         else:
             logger.warning(f"No active session found for role change event for user {uid} in channel {channel_name} (session may not exist yet - will be applied when session is created)")
             # Note: When join event arrives later, it should check for pending role changes
             # For now, the role event is stored in role_events table and can be applied retroactively
     
-    async def _update_metrics(self, app_id: str, webhook_data: WebhookRequest, channel_session_id: str = None):
+    def _update_metrics(self, app_id: str, webhook_data: WebhookRequest, event_time: datetime, channel_session_id: str = None):
         """Update aggregated metrics tables"""
-        # This will be called after each webhook to update daily metrics
-        # For now, we'll implement a simple version that updates metrics
-        # In production, you might want to batch these updates
+        # User counts and minutes are applied as deltas when sessions open and close
+        # (see _apply_join_delta / _apply_leave_delta); only channel activity bounds move here
+        event_type = webhook_data.eventType
+        if event_type not in ACTIVITY_EVENT_TYPES:
+            return
         
         channel_name = webhook_data.payload.channelName
-        uid = webhook_data.payload.uid
-        event_date = datetime.fromtimestamp(webhook_data.payload.ts).date()
-        event_datetime = datetime.combine(event_date, datetime.min.time())
         
         # Use the channel_session_id passed from the main processing function
         # This ensures we have the correct session ID even for channel destroy events
@@ -808,171 +1175,182 @@ class WebhookProcessor:
             session_key = f"{app_id}:{channel_name}"
             channel_session_id = self.active_channel_sessions.get(session_key)
         
-        # Update channel metrics
-        await self._update_channel_metrics(app_id, channel_name, event_datetime, channel_session_id)
+        # First activity is the channel create (101); last is a channel destroy or user leave
+        delta = self._channel_delta(app_id, channel_name, channel_session_id, self._metrics_date(event_time))
+        if event_type == 101:
+            if delta['first_activity'] is None or event_time < delta['first_activity']:
+                delta['first_activity'] = event_time
+        elif delta['last_activity'] is None or event_time > delta['last_activity']:
+            delta['last_activity'] = event_time
+    
+    def _metrics_date(self, moment: datetime) -> datetime:
+        """Midnight of the day a metrics row aggregates"""
+        return datetime.combine(moment.date(), datetime.min.time())
+    
+    def _channel_delta(self, app_id: str, channel_name: str, channel_session_id: str, date: datetime) -> Dict[str, Any]:
+        """In-memory changes to a channel metrics row, held until the batch writes them back"""
+        key = (app_id, channel_name, channel_session_id, date)
+        delta = self.channel_deltas.get(key)
+        if delta is None:
+            # first_sessions: UID -> lowest session id counted this batch, settled into unique_users on write-back
+            delta = self.channel_deltas[key] = {
+                'total_users': 0, 'total_minutes': 0.0, 'first_activity': None, 'last_activity': None, 'first_sessions': {}
+            }
+        return delta
+    
+    def _user_delta(self, app_id: str, uid: int, channel_name: str, date: datetime, channel_session_id: str) -> Dict[str, Any]:
+        """In-memory changes to a user metrics row, held until the batch writes them back"""
+        key = (app_id, uid, channel_name, date)
+        delta = self.user_deltas.get(key)
+        if delta is None:
+            delta = self.user_deltas[key] = {'channel_session_id': channel_session_id, 'session_count': 0, 'total_minutes': 0.0}
+        return delta
+    
+    def _apply_join_delta(self, app_id: str, session: ChannelSession):
+        """Count a session towards its channel and user metrics for the join day (with its minutes if already closed)"""
+        date = self._metrics_date(session.join_time)
+        minutes = (session.duration_seconds or 0) / 60.0
+        
+        channel = self._channel_delta(app_id, session.channel_name, session.channel_session_id, date)
+        channel['total_minutes'] += minutes
+        # UID 0 is excluded from channel user counts
+        if session.uid > 0:
+            channel['total_users'] += 1
+            first_session_id = channel['first_sessions'].get(session.uid)
+            if first_session_id is None or session.id < first_session_id:
+                channel['first_sessions'][session.uid] = session.id
         
-        # Update user metrics only if uid is available
-        if uid is not None:
-            await self._update_user_metrics(app_id, uid, channel_name, event_datetime, channel_session_id)
+        user = self._user_delta(app_id, session.uid, session.channel_name, date, session.channel_session_id)
+        user['session_count'] += 1
+        user['total_minutes'] += minutes
     
-    async def _update_channel_metrics(self, app_id: str, channel_name: str, date: datetime, channel_session_id: str = None):
-        """Update or create channel metrics for a specific date and channel session"""
-        # First, try to find existing metrics for this exact combination
-        metrics = self.db.query(ChannelMetrics).filter(
-            ChannelMetrics.app_id == app_id,
-            ChannelMetrics.channel_name == channel_name,
-            ChannelMetrics.channel_session_id == channel_session_id,
-            ChannelMetrics.date == date
-        ).first()
+    def _apply_leave_delta(self, app_id: str, session: ChannelSession):
+        """Add a closed session's minutes to its channel and user metrics for the join day"""
+        minutes = (session.duration_seconds or 0) / 60.0
+        date = self._metrics_date(session.join_time)
         
-        # If not found, we'll create a new metrics record
-        # Each channel session should have its own metrics record
+        self._channel_delta(app_id, session.channel_name, session.channel_session_id, date)['total_minutes'] += minutes
+        self._user_delta(app_id, session.uid, session.channel_name, date, session.channel_session_id)['total_minutes'] += minutes
+    
+    def _unique_users_delta(self, app_id: str, channel_name: str, channel_session_id: str, date: datetime, first_sessions: Dict[int, int]):
+        """SQL counting the batch's UIDs that have no earlier session in this epoch that day"""
+        return sum(
+            case((
+                self.db.query(ChannelSession.id).filter(
+                    ChannelSession.app_id == app_id,
+                    ChannelSession.channel_name == channel_name,
+                    ChannelSession.channel_session_id == channel_session_id,
+                    ChannelSession.uid == uid,
+                    ChannelSession.join_time >= date,
+                    ChannelSession.join_time < date + timedelta(days=1),
+                    ChannelSession.id < first_session_id
+                ).exists(), 0
+            ), else_=1)
+            for uid, first_session_id in first_sessions.items()
+        )
+    
+    def _write_metric_deltas(self):
+        """Write the batch's metric deltas back to the database (caller commits)"""
+        # Rows go out grouped by (app_id, channel_name) in a fixed order, so writers in other processes
+        # lock the same metrics rows in the same order and can't deadlock on each other's batches
+        channel_rows = []
+        for (app_id, channel_name, channel_session_id, date), delta in sorted(
+            self.channel_deltas.items(), key=lambda item: (item[0][0], item[0][1], item[0][2] or '', item[0][3])
+        ):
+            channel_rows.append({
+                'app_id': app_id,
+                'channel_name': channel_name,
+                'channel_session_id': channel_session_id,
+                'date': date,
+                'total_users': delta['total_users'],
+                'unique_users': self._unique_users_delta(app_id, channel_name, channel_session_id, date, delta['first_sessions']),
+                'total_minutes': delta['total_minutes'],
+                'first_activity': delta['first_activity'],
+                'last_activity': delta['last_activity']
+            })
+        user_rows = [
+            {'app_id': app_id, 'uid': uid, 'channel_name': channel_name, 'date': date, **delta}
+            for (app_id, uid, channel_name, date), delta in sorted(
+                self.user_deltas.items(), key=lambda item: (item[0][0], item[0][2], item[0][1], item[0][3])
+            )
+        ]
         
-        # Calculate metrics from both sessions and raw webhook events for this channel session
-        sessions = self.db.query(ChannelSession).filter(
+        self._upsert_metric_rows(ChannelMetrics, CHANNEL_METRICS_KEY, CHANNEL_METRICS_COUNTERS, channel_rows)
+        self._upsert_metric_rows(UserMetrics, USER_METRICS_KEY, USER_METRICS_COUNTERS, user_rows)
+        for key in sorted(self.recount_channel_keys):
+            self._recount_channel_metrics(*key)
+        self._clear_metric_deltas()
+    
+    def _recount_channel_metrics(self, app_id: str, channel_name: str, channel_session_id: str, date: datetime):
+        """Reset a channel metrics row's counters from the sessions that joined its epoch that day"""
+        total_users, unique_users, total_seconds = self.db.query(
+            func.sum(case((ChannelSession.uid > 0, 1), else_=0)),
+            func.count(func.distinct(case((ChannelSession.uid > 0, ChannelSession.uid)))),
+            func.sum(ChannelSession.duration_seconds)
+        ).filter(
             ChannelSession.app_id == app_id,
             ChannelSession.channel_name == channel_name,
             ChannelSession.channel_session_id == channel_session_id,
             ChannelSession.join_time >= date,
             ChannelSession.join_time < date + timedelta(days=1)
-        ).all()
-        
-        # Also get webhook events for this channel session/date to count total activity
-        webhook_events = self.db.query(WebhookEvent).filter(
-            WebhookEvent.app_id == app_id,
-            WebhookEvent.channel_name == channel_name,
-            WebhookEvent.channel_session_id == channel_session_id,
-            WebhookEvent.ts >= int(date.timestamp()),
-            WebhookEvent.ts < int((date + timedelta(days=1)).timestamp())
-        ).all()
-        
-        # Calculate metrics
-        total_minutes = sum(s.duration_seconds or 0 for s in sessions) / 60.0
-        unique_users = len(set(s.uid for s in sessions if s.uid > 0))  # Exclude UID 0
-        total_users = len([s for s in sessions if s.uid > 0])  # Exclude UID 0
-        
-        # Calculate first and last activity timestamps
-        first_activity = None
-        last_activity = None
-        
-        # Get first activity from webhook events (channel create)
-        channel_create_events = self.db.query(WebhookEvent).filter(
-            WebhookEvent.app_id == app_id,
-            WebhookEvent.channel_name == channel_name,
-            WebhookEvent.channel_session_id == channel_session_id,
-            WebhookEvent.event_type == 101,  # channel_created
-            WebhookEvent.ts >= int(date.timestamp()),
-            WebhookEvent.ts < int((date + timedelta(days=1)).timestamp())
-        ).order_by(WebhookEvent.ts).first()
-        
-        if channel_create_events:
-            first_activity = datetime.fromtimestamp(channel_create_events.ts)
+        ).one()
+        self.db.query(ChannelMetrics).filter(
+            ChannelMetrics.app_id == app_id,
+            ChannelMetrics.channel_name == channel_name,
+            ChannelMetrics.channel_session_id == channel_session_id,
+            ChannelMetrics.date == date
+        ).update({
+            ChannelMetrics.total_users: total_users or 0,
+            ChannelMetrics.unique_users: unique_users or 0,
+            ChannelMetrics.total_minutes: (total_seconds or 0) / 60.0
+        }, synchronize_session=False)
+    
+    def _clear_metric_deltas(self):
+        """Forget metric deltas (after they are written or rolled back)"""
+        self.channel_deltas.clear()
+        self.user_deltas.clear()
+        self.recount_channel_keys.clear()
+    
+    def _upsert_metric_rows(self, model, key_columns: tuple, counter_columns: tuple, rows: List[Dict[str, Any]]):
+        """Add delta rows onto metrics rows: one multi-row INSERT ... ON CONFLICT DO UPDATE where supported"""
+        insert_statement = UPSERT_INSERTS.get(self.db.get_bind().dialect.name)
         
-        # Get last activity from webhook events (channel destroy or last user leave)
-        last_events = self.db.query(WebhookEvent).filter(
-            WebhookEvent.app_id == app_id,
-            WebhookEvent.channel_name == channel_name,
-            WebhookEvent.channel_session_id == channel_session_id,
-            WebhookEvent.event_type.in_([102, 104, 106, 108]),  # channel_destroyed, broadcaster_leave, audience_leave, communication_leave
-            WebhookEvent.ts >= int(date.timestamp()),
-            WebhookEvent.ts < int((date + timedelta(days=1)).timestamp())
-        ).order_by(WebhookEvent.ts.desc()).first()
-        
-        if last_events:
-            last_activity = datetime.fromtimestamp(last_events.ts)
-        
-        # If no sessions but we have webhook events, count the events as activity
-        if total_users == 0 and len(webhook_events) > 0:
-            total_users = len(webhook_events)
-            unique_users = len(set(e.uid for e in webhook_events if e.uid > 0))
-        
-        if not metrics:
-            # Create new metrics record
-            metrics = ChannelMetrics(
-                app_id=app_id,
-                channel_name=channel_name,
-                channel_session_id=channel_session_id,
-                date=date,
-                total_users=total_users,
-                total_minutes=total_minutes,
-                unique_users=unique_users,
-                first_activity=first_activity,
-                last_activity=last_activity
+        # NULL key columns never conflict, so those rows (and other dialects) go through the per-row path
+        bulk_rows = []
+        for row in rows:
+            if insert_statement is not None and all(row[column] is not None for column in key_columns):
+                bulk_rows.append(row)
+                continue
+            updates = {column: getattr(model, column) + row[column] for column in counter_columns}
+            for column in ACTIVITY_COLUMNS:
+                if column in row:
+                    updates[column] = keep_activity_bound(getattr(model, column), literal(row[column]), column == 'first_activity')
+            self._upsert_metrics(
+                model,
+                key={column: row[column] for column in key_columns},
+                values={column: value for column, value in row.items() if column not in key_columns},
+                updates=updates
             )
-            self.db.add(metrics)
-        else:
-            # Update existing metrics - recalculate from scratch to avoid double counting
-            # This ensures we get the correct totals even if called multiple times
-            metrics.total_minutes = total_minutes
-            metrics.total_users = total_users
-            metrics.unique_users = unique_users
-            
-            # Update activity timestamps
-            if first_activity and (not metrics.first_activity or first_activity < metrics.first_activity):
-                metrics.first_activity = first_activity
-            if last_activity and (not metrics.last_activity or last_activity > metrics.last_activity):
-                metrics.last_activity = last_activity
-            
-            metrics.updated_at = datetime.utcnow()
-    
-    async def _update_user_metrics(self, app_id: str, uid: int, channel_name: str, date: datetime, channel_session_id: str = None):
-        """Update or create user metrics for a specific date and channel session"""
-        # First, try to find existing metrics for this exact combination
-        metrics = self.db.query(UserMetrics).filter(
-            UserMetrics.app_id == app_id,
-            UserMetrics.uid == uid,
-            UserMetrics.channel_name == channel_name,
-            UserMetrics.channel_session_id == channel_session_id,
-            UserMetrics.date == date
-        ).first()
-        
-        # If not found, try to find metrics for the same app_id, uid, channel_name, and date but different channel_session_id
-        if not metrics:
-            metrics = self.db.query(UserMetrics).filter(
-                UserMetrics.app_id == app_id,
-                UserMetrics.uid == uid,
-                UserMetrics.channel_name == channel_name,
-                UserMetrics.date == date
-            ).first()
         
-        if not metrics:
-            # Calculate metrics for this user/date/channel session
-            sessions = self.db.query(ChannelSession).filter(
-                ChannelSession.app_id == app_id,
-                ChannelSession.uid == uid,
-                ChannelSession.channel_name == channel_name,
-                ChannelSession.channel_session_id == channel_session_id,
-                ChannelSession.join_time >= date,
-                ChannelSession.join_time < date + timedelta(days=1)
-            ).all()
-            
-            total_minutes = sum(s.duration_seconds or 0 for s in sessions) / 60.0
-            session_count = len(sessions)
-            
-            metrics = UserMetrics(
-                app_id=app_id,
-                uid=uid,
-                channel_name=channel_name,
-                channel_session_id=channel_session_id,
-                date=date,
-                total_minutes=total_minutes,
-                session_count=session_count
-            )
-            self.db.add(metrics)
-        else:
-            # Recalculate metrics for all sessions for this user/date/channel
-            all_sessions = self.db.query(ChannelSession).filter(
-                ChannelSession.app_id == app_id,
-                ChannelSession.uid == uid,
-                ChannelSession.channel_name == channel_name,
-                ChannelSession.join_time >= date,
-                ChannelSession.join_time < date + timedelta(days=1)
-            ).all()
-            
-            metrics.total_minutes = sum(s.duration_seconds or 0 for s in all_sessions) / 60.0
-            metrics.session_count = len(all_sessions)
-            metrics.updated_at = datetime.utcnow()
+        if not bulk_rows:
+            return
+        now = datetime.utcnow()
+        statement = insert_statement(model).values([{**row, 'created_at': now, 'updated_at': now} for row in bulk_rows])
+        updates = {column: getattr(model, column) + statement.excluded[column] for column in counter_columns}
+        for column in ACTIVITY_COLUMNS:
+            if column in bulk_rows[0]:
+                updates[column] = keep_activity_bound(getattr(model, column), statement.excluded[column], column == 'first_activity')
+        self.db.execute(statement.on_conflict_do_update(index_elements=list(key_columns), set_={**updates, 'updated_at': now}))
+    
+    def _upsert_metrics(self, model, key: Dict[str, Any], values: Dict[str, Any], updates: Dict[str, Any]):
+        """Apply SQL-side updates to one metrics row without reading it, creating the row from values if missing"""
+        updated = self.db.query(model).filter(
+            *(getattr(model, column) == value for column, value in key.items())  # None compares as IS NULL
+        ).update(updates, synchronize_session=False)
+        if not updated:
+            self.db.add(model(**key, **values))
+            self.db.flush()
     
     def close(self):
-        """Close database connection"""
-        self.db.close()
+        """Stop the database thread once the batch it is applying has finished"""
+        self.db_executor.shutdown(wait=True)